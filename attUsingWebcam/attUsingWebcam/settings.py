@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -95,6 +96,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'attUsingWebcam.wsgi.application'
+ASGI_APPLICATION = 'attUsingWebcam.asgi.application'
 
 
 # Database
@@ -107,6 +109,56 @@ DATABASES = {
     }
 }
 
+# Production database mode (ATTENDANCE_DB_MODE=production): WAL so readers
+# never block the writer, write transactions that take the lock up front and
+# wait for it instead of failing with "database is locked", persistent
+# connections, and attendance inserts coalesced by a writer thread (see
+# attendance/write_queue.py). The queue only coalesces writes within one
+# process; with several WSGI/ASGI workers each has its own writer, and the
+# unique (student, date) constraint on Attendance keeps them from
+# recording a student twice.
+ATTENDANCE_DB_MODE = os.environ.get('ATTENDANCE_DB_MODE', 'development')
+ATTENDANCE_WRITE_QUEUE = ATTENDANCE_DB_MODE == 'production'
+
+if ATTENDANCE_DB_MODE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,  # busy_timeout, in seconds
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-20000;'
+                'PRAGMA mmap_size=134217728;'
+                'PRAGMA journal_size_limit=67108864;'
+            ),
+        },
+    })
+
+# Gallery/payload version tokens (attendance/versions.py) must be shared by
+# every server process and by management commands, so the default per-process
+# LocMemCache is not enough. A file cache works for all processes on one host;
+# set ATTENDANCE_CACHE_URL=redis://... when workers run on several hosts.
+ATTENDANCE_CACHE_URL = os.environ.get('ATTENDANCE_CACHE_URL')
+if ATTENDANCE_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': ATTENDANCE_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'var' / 'cache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -160,3 +212,27 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
 
+
+# Default backend for AttendanceUploadAPIView: 'opencv', 'opencv-hw' or 'pyav'.
+# Clients can override it per request with the 'decoder' form field.
+VIDEO_DECODER = 'opencv'
+
+# Seconds of processing allowed per uploaded video. The budget is spread over
+# the whole video; responses say how much of it was analysed.
+VIDEO_PROCESSING_BUDGET = 30
+
+# Largest face distance accepted as a match (see the replay_recognition
+# command for tuning it against RecognitionLog), the nearest students
+# reported per detected face, and how far the best match must beat the
+# runner-up to be accepted (0 disables the margin check).
+RECOGNITION_TOLERANCE = 0.5
+RECOGNITION_TOP_K = 3
+RECOGNITION_MIN_MARGIN = 0.0
+
+# Store every face's candidates and distances in RecognitionLog so thresholds
+# can be tuned offline without re-running detection.
+RECOGNITION_LOG = True
+
+# Size of the thread pool the async upload views use for decode/detect/encode.
+# None means one thread per CPU core.
+RECOGNITION_THREADS = None
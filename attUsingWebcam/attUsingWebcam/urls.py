@@ -1,10 +1,19 @@
 # attendance_system/urls.py
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from attendance.views import serve_derived_image
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('attendance.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.DEBUG:
+    # Development only, like static() below. In production the web server
+    # serves /media/derived/ with the same cache headers (deploy/nginx.conf).
+    urlpatterns += [
+        re_path(r'^media/derived/(?P<path>.*)$', serve_derived_image, name='derived-image'),
+    ]
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,6 +1,12 @@
 from django.contrib import admin
-from .models import Student,Attendance
+from .models import Student,Attendance,Camera,Course,Section,ClassSession,FaceEncoding,RecognitionLog
 
 
 admin.site.register(Student)
-admin.site.register(Attendance)
\ No newline at end of file
+admin.site.register(Attendance)
+admin.site.register(Camera)
+admin.site.register(Course)
+admin.site.register(Section)
+admin.site.register(ClassSession)
+admin.site.register(FaceEncoding)
+admin.site.register(RecognitionLog)
@@ -0,0 +1,190 @@
+# attendance/async_views.py
+#
+# Async variants of the image and video upload endpoints for ASGI servers
+# (e.g. `uvicorn attUsingWebcam.asgi:application`). Decoding, detection and
+# encoding run in a bounded thread pool where OpenCV/dlib can run in parallel,
+# while the event loop stays free to accept more kiosk uploads; matching and
+# the attendance writes happen back on the loop.
+import os
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from .models import Camera, ClassSession
+from .video_decoders import choose_decoder
+from .completion import CompletionPolicy
+from .gallery import get_galleries
+from .recognition import (
+    acreate_attendance_records,
+    asave_recognition_log,
+    decode_image,
+    detect_and_encode,
+    match_faces,
+    recognition_log,
+    scan_video,
+)
+
+
+logger = logging.getLogger(__name__)
+
+recognition_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'RECOGNITION_THREADS', None) or os.cpu_count(),
+    thread_name_prefix='recognition',
+)
+
+
+async def run_in_pool(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(recognition_executor, partial(func, *args, **kwargs))
+
+
+def write_temp_video(video_file):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp_file:
+        for chunk in video_file.chunks():
+            tmp_file.write(chunk)
+        return tmp_file.name
+
+
+def remove_temp_video(temp_path):
+    try:
+        os.unlink(temp_path)
+        logger.info(f"Temporary file {temp_path} deleted")
+    except PermissionError:
+        logger.warning(f"Could not delete temporary file {temp_path}")
+
+
+async def get_camera_layout(camera_id):
+    """Return (layout, error_response) for the optional 'camera' request field."""
+    if not camera_id:
+        return None, None
+    try:
+        camera = await Camera.objects.aget(pk=camera_id)
+    except (Camera.DoesNotExist, ValueError):
+        return None, JsonResponse({"error": "Unknown camera."}, status=400)
+    return camera.layout(), None
+
+
+async def get_request_galleries(session_id):
+    """Return ((gallery, fallback), error_response) for the optional 'session' request field."""
+    try:
+        return await sync_to_async(get_galleries)(session_id), None
+    except (ClassSession.DoesNotExist, ValueError):
+        return None, JsonResponse({"error": "Unknown session."}, status=400)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAttendanceImageUploadView(View):
+    http_method_names = ['post']
+
+    async def post(self, request):
+        try:
+            image_file = request.FILES.get('image')
+            if not image_file:
+                return JsonResponse({"error": "No image file provided."}, status=400)
+
+            # Validate image size
+            max_size = 10 * 1024 * 1024  # 10 MB
+            if image_file.size > max_size:
+                return JsonResponse({"error": "Image file is too large. Maximum allowed size is 10 MB."}, status=400)
+
+            layout, error = await get_camera_layout(request.POST.get('camera'))
+            if error:
+                return error
+            galleries, error = await get_request_galleries(request.POST.get('session'))
+            if error:
+                return error
+
+            image_data = image_file.read()
+            rgb_image = await run_in_pool(decode_image, image_data, max_dimension=None if layout else 2000)
+            encodings = await run_in_pool(detect_and_encode, rgb_image, layout=layout)
+
+            gallery, fallback = galleries
+            result = match_faces(encodings, gallery, fallback=fallback)
+            await acreate_attendance_records(result.students)
+            await asave_recognition_log(recognition_log(
+                [(None, None, result)], 'image',
+                request.POST.get('session') or None, request.POST.get('camera') or None
+            ))
+
+            return JsonResponse({
+                "message": "Attendance marked.",
+                "students": [s.name for s in result.students],
+                "faces": result.faces(),
+            })
+
+        except Exception as e:
+            logger.error(f"Error processing request: {str(e)}", exc_info=True)
+            return JsonResponse({"error": "Internal server error"}, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAttendanceUploadView(View):
+    http_method_names = ['post']
+
+    async def post(self, request):
+        temp_path = None
+        try:
+            video_file = request.FILES.get('video')
+            if not video_file:
+                return JsonResponse({"error": "No video file provided."}, status=400)
+
+            # Validate video file
+            max_size = 50 * 1024 * 1024  # 50 MB
+            if video_file.size > max_size:
+                return JsonResponse({"error": "Video file is too large. Maximum allowed size is 50 MB."}, status=400)
+
+            # "fast" mode only looks at keyframes (I-frames)
+            fast = request.POST.get('mode') == 'fast'
+            try:
+                decoder = choose_decoder(request.POST.get('decoder'), fast, getattr(settings, 'VIDEO_DECODER', 'opencv'))
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+
+            layout, error = await get_camera_layout(request.POST.get('camera'))
+            if error:
+                return error
+            galleries, error = await get_request_galleries(request.POST.get('session'))
+            if error:
+                return error
+
+            gallery, fallback = galleries
+            try:
+                policy = CompletionPolicy.from_request(request.POST, gallery, session=bool(request.POST.get('session')))
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+
+            temp_path = await run_in_pool(write_temp_video, video_file)
+            # Per-frame matching is interleaved with decoding, so the whole
+            # scan runs in the pool; only the DB write comes back to the loop.
+            scan = await run_in_pool(
+                scan_video, temp_path, gallery, decoder=decoder, fast=fast, layout=layout,
+                fallback=fallback, policy=policy
+            )
+            await acreate_attendance_records(scan.students)
+            await asave_recognition_log(recognition_log(
+                scan.matches, 'video', request.POST.get('session') or None, request.POST.get('camera') or None
+            ))
+
+            return JsonResponse({
+                "message": "Attendance marked.",
+                "students": [s.name for s in scan.students],
+                "decoder": decoder,
+                "mode": "fast" if fast else "normal",
+                "stop_reason": scan.stop_reason,
+                "partial": scan.partial,
+                "coverage": scan.coverage,
+            })
+
+        except Exception as e:
+            logger.error(f"Error processing video request: {str(e)}", exc_info=True)
+            return JsonResponse({"error": "Internal server error"}, status=500)
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                await run_in_pool(remove_temp_video, temp_path)
@@ -0,0 +1,102 @@
+# attendance/budget.py
+import time
+
+
+class FrameBudget:
+    """Spreads a processing-time budget evenly over the whole video.
+
+    The decoder yields every sampled frame; for each one the budget decides
+    whether to analyse it. Per-frame decode and analysis costs are tracked as
+    moving averages, and after every analysed frame the next analysis time is
+    pushed out so the remaining budget lasts until the end of the video. When
+    even decoding the rest of a long video would not fit, analysis still keeps
+    ``analysis_share`` of the remaining time and is spread over the part of
+    the video decoding can reach. The scan only stops when decoding the next
+    frame no longer fits.
+    """
+
+    smoothing = 0.3  # weight of the newest timing in the moving averages
+    analysis_share = 0.5  # minimum share of the remaining time kept for analysis
+
+    def __init__(self, seconds, video_duration=None, clock=time.perf_counter):
+        self.seconds = seconds
+        self.video_duration = video_duration
+        self.clock = clock
+        self.started = clock()
+        self.last_tick = self.started
+        self.decode_cost = None  # seconds to decode one sampled frame
+        self.analysis_cost = None  # seconds to detect/encode/match one frame
+        self.sample_interval = None  # video seconds between sampled frames
+        self.last_sample = None
+        self.next_analysis = 0.0  # video time of the next frame worth analysing
+        self.analysed = []  # video timestamps of analysed frames
+        self.position = 0.0  # video time of the last decoded frame
+
+    def _average(self, current, value):
+        return value if current is None else current + self.smoothing * (value - current)
+
+    def remaining(self):
+        return self.seconds - (self.clock() - self.started)
+
+    def frame_decoded(self, seconds):
+        """Call as soon as the decoder yields a frame; returns whether to analyse it."""
+        now = self.clock()
+        self.decode_cost = self._average(self.decode_cost, now - self.last_tick)
+        self.last_tick = now
+        # The first sampled frame sits one interval into the video
+        previous = self.last_sample if self.last_sample is not None else 0.0
+        if seconds > previous:
+            self.sample_interval = self._average(self.sample_interval, seconds - previous)
+        self.last_sample = self.position = seconds
+        return seconds >= self.next_analysis and self.remaining() >= (self.analysis_cost or 0.0)
+
+    def exhausted(self):
+        """True when decoding one more frame would overshoot the budget."""
+        return self.remaining() < (self.decode_cost or 0.0)
+
+    def reached_end(self):
+        """True when the last decoded frame is the last sampled frame of the video."""
+        if not self.video_duration or not self.sample_interval:
+            return False
+        return self.position + self.sample_interval >= self.video_duration
+
+    def frame_analysed(self, seconds):
+        now = self.clock()
+        self.analysis_cost = self._average(self.analysis_cost, now - self.last_tick)
+        self.last_tick = now
+        self.analysed.append(seconds)
+        self.schedule(seconds)
+
+    def schedule(self, seconds):
+        if not self.video_duration or not self.sample_interval:
+            self.next_analysis = seconds
+            return
+        remaining = max(self.remaining(), 0.0)
+        video_left = max(self.video_duration - seconds, 0.0)
+        # Budget seconds it takes to decode one second of video
+        decode_rate = (self.decode_cost or 0.0) / self.sample_interval
+        if video_left * decode_rate <= remaining * (1 - self.analysis_share):
+            analysis_time = remaining - video_left * decode_rate
+            horizon = video_left
+        else:
+            # The end is out of reach: spread analysis over what decoding can reach
+            analysis_time = remaining * self.analysis_share
+            horizon = (remaining - analysis_time) / decode_rate
+        affordable = analysis_time / self.analysis_cost if self.analysis_cost else float('inf')
+        if affordable < 1:
+            # Not even one more frame fits; keep decoding so coverage is reported up to the end
+            self.next_analysis = float('inf')
+        else:
+            # Leave as much video after the last analysed frame as between the others
+            self.next_analysis = seconds + horizon / (affordable + 1)
+
+    def coverage(self):
+        points = [0.0] + self.analysed + [self.video_duration or self.position]
+        return {
+            "video_seconds": round(self.video_duration, 2) if self.video_duration else None,
+            "seconds_decoded": round(self.position, 2),
+            "frames_analysed": len(self.analysed),
+            # How far apart analysed frames are at worst; small means evenly covered
+            "largest_gap_seconds": round(max(b - a for a, b in zip(points, points[1:])), 2),
+            "processing_seconds": round(self.clock() - self.started, 2),
+        }
@@ -0,0 +1,85 @@
+# attendance/completion.py
+from collections import Counter
+
+
+# Why scan_video stopped decoding
+END_OF_VIDEO = 'end_of_video'
+TIME_LIMIT = 'time_limit'
+ROSTER_COMPLETE = 'roster_complete'
+HEADCOUNT_REACHED = 'headcount_reached'
+NO_NEW_FACES = 'no_new_faces'
+
+
+class CompletionPolicy:
+    """Decides when a video has told us everything we expect from it.
+
+    A student is confirmed once they were matched in ``min_votes`` sampled
+    frames. Decoding stops when every expected student is confirmed, when
+    ``expected_count`` students are confirmed, or when ``patience`` sampled
+    frames in a row brought no identity that had not been seen before
+    (counted from the first matched identity on).
+    """
+
+    def __init__(self, expected_ids=None, expected_count=None, min_votes=2, patience=None):
+        self.expected_ids = set(expected_ids) if expected_ids else None
+        self.expected_count = expected_count
+        self.min_votes = max(1, min_votes)
+        self.patience = patience
+        self.votes = Counter()
+        self.frames_without_new = 0
+
+    @property
+    def active(self):
+        return bool(self.expected_ids or self.expected_count or self.patience)
+
+    @classmethod
+    def from_request(cls, data, gallery=None, session=False):
+        """Build a policy from the upload form fields; raises ValueError with a client-facing message.
+
+        expected        'roster' (the session roster) or comma-separated student primary keys
+        expected_count  stop once this many students are confirmed
+        min_votes       sampled frames a student must be matched in to count as confirmed (default 2)
+        patience        stop after this many sampled frames without a new identity
+        """
+        expected_ids = None
+        expected = data.get('expected')
+        if expected == 'roster':
+            if not session:
+                raise ValueError("expected=roster requires a session.")
+            expected_ids = list(gallery.index)
+        elif expected:
+            try:
+                expected_ids = [int(pk) for pk in expected.split(',') if pk.strip()]
+            except ValueError:
+                raise ValueError("expected must be 'roster' or a comma-separated list of student ids.") from None
+
+        values = {}
+        for name in ('expected_count', 'min_votes', 'patience'):
+            if data.get(name) in (None, ''):
+                continue
+            try:
+                values[name] = int(data.get(name))
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be an integer.") from None
+            if values[name] < 1:
+                raise ValueError(f"{name} must be positive.")
+        return cls(expected_ids=expected_ids, **values)
+
+    def update(self, students):
+        """Record the students matched in one sampled frame; return a stop reason or None."""
+        new = [student for student in students if student.id not in self.votes]
+        self.votes.update(student.id for student in students)
+        # An empty room before the first student walks in is not "no new faces"
+        if new:
+            self.frames_without_new = 0
+        elif self.votes:
+            self.frames_without_new += 1
+
+        confirmed = {student_id for student_id, votes in self.votes.items() if votes >= self.min_votes}
+        if self.expected_ids and self.expected_ids <= confirmed:
+            return ROSTER_COMPLETE
+        if self.expected_count and len(confirmed) >= self.expected_count:
+            return HEADCOUNT_REACHED
+        if self.patience and self.frames_without_new >= self.patience:
+            return NO_NEW_FACES
+        return None
@@ -0,0 +1,63 @@
+# attendance/encoding.py
+#
+# Enrollment-image encoding without any Django dependency, so it can also run
+# inside worker processes (see the reencode_faces management command).
+import json
+import cv2
+import face_recognition
+from .face_models import face_encodings, face_locations
+
+
+# Longest side enrollment images are encoded at. Saves and the reencode_faces
+# command both use it, so a stored encoding does not depend on which one ran.
+ENROLLMENT_DIMENSION = 1000
+
+
+def load_rgb(path, max_dimension=None):
+    """Read an image file as RGB, downscaled so its longest side is at most max_dimension."""
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        # Formats OpenCV cannot read go through PIL, which already returns RGB
+        rgb_image = face_recognition.load_image_file(path)
+    else:
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return downscale(rgb_image, max_dimension) if max_dimension else rgb_image
+
+
+def downscale(image, max_dimension):
+    height, width = image.shape[:2]
+    if max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    return image
+
+
+def encode_face(rgb_image):
+    """Encoding of the largest face in the image, or None."""
+    locations = face_locations(rgb_image)
+    if not locations:
+        return None
+    # Enrollment photos may catch someone in the background; use the biggest face
+    largest = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+    return face_encodings(rgb_image, [largest])[0]
+
+
+def encode_image_file(path, max_dimension=None):
+    """JSON encoding of the largest face found in an image file, or None."""
+    encoding = encode_face(load_rgb(path, max_dimension))
+    if encoding is not None:
+        return json.dumps(encoding.tolist())
+    return None
+
+
+def encode_task(task):
+    """Process-pool worker: (pk, image path, max dimension) -> (pk, encoding JSON or None, error or None).
+
+    Lives here rather than in the management command so that workers started
+    with "spawn" (Windows, macOS) can import it without setting up Django.
+    """
+    pk, path, max_dimension = task
+    try:
+        return pk, encode_image_file(path, max_dimension), None
+    except Exception as e:
+        return pk, None, str(e)
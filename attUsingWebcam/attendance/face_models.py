@@ -0,0 +1,40 @@
+# attendance/face_models.py
+#
+# Thread-safe HOG detection and face encoding, without any Django dependency
+# so enrollment (encoding.py) and worker processes can use it as well.
+import threading
+import dlib
+import numpy as np
+import face_recognition
+import face_recognition_models
+
+
+# dlib's face encoder is a DNN that keeps its activations on the network
+# object, so concurrent calls from several threads corrupt each other.
+# Each thread gets its own copy of the detector and encoder.
+_thread_models = threading.local()
+
+
+def _models():
+    if not hasattr(_thread_models, 'face_encoder'):
+        _thread_models.face_detector = dlib.get_frontal_face_detector()
+        _thread_models.face_encoder = dlib.face_recognition_model_v1(
+            face_recognition_models.face_recognition_model_location()
+        )
+    return _thread_models
+
+
+def face_locations(rgb_image, number_of_times_to_upsample=1):
+    """HOG face detection, returning css (top, right, bottom, left) boxes like face_recognition."""
+    height, width = rgb_image.shape[:2]
+    return [
+        (max(rect.top(), 0), min(rect.right(), width), min(rect.bottom(), height), max(rect.left(), 0))
+        for rect in _models().face_detector(rgb_image, number_of_times_to_upsample)
+    ]
+
+
+def face_encodings(rgb_image, locations):
+    """Thread-safe equivalent of face_recognition.face_encodings (5-point landmarks)."""
+    landmarks = face_recognition.api._raw_face_landmarks(rgb_image, locations, model="small")
+    encoder = _models().face_encoder
+    return [np.array(encoder.compute_face_descriptor(rgb_image, landmark_set, 1)) for landmark_set in landmarks]
@@ -0,0 +1,280 @@
+# attendance/gallery.py
+import json
+import logging
+import threading
+from collections import defaultdict
+import numpy as np
+from django.db.models import Q
+from .models import ClassSession, FaceEncoding, Student
+from .versions import get_version
+
+
+logger = logging.getLogger(__name__)
+
+ENCODING_SIZE = 128
+# Hot-path rows per student beyond the centroid
+MAX_MEDOIDS = 2
+# Faces whose best compact distance is this close to the threshold are
+# re-ranked against the full encoding sets of their nearest candidates.
+RERANK_MARGIN = 0.05
+RERANK_CANDIDATES = 3
+# Nearest students kept per face in a MatchResult
+TOP_K = 3
+
+_galleries = {}  # key -> (version, Gallery)
+_galleries_lock = threading.Lock()
+
+
+def _pairwise_distances(a, b):
+    squared = (
+        np.einsum('ij,ij->i', a, a)[:, None]
+        + np.einsum('ij,ij->i', b, b)[None, :]
+        - 2.0 * a @ b.T
+    )
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def compact_encodings(encodings):
+    """Centroid alone for up to MAX_MEDOIDS + 1 encodings, plus MAX_MEDOIDS greedy medoids beyond that.
+
+    Faces that could still be within the threshold of one of the full
+    encodings are re-ranked against them (see Gallery.radii).
+    """
+    rows = [encodings.mean(axis=0)]
+    if len(encodings) <= MAX_MEDOIDS + 1:
+        return np.vstack(rows)
+    distances = _pairwise_distances(encodings, encodings)
+    # Greedy k-medoids BUILD: each new medoid is the point that most reduces
+    # the distance from every encoding to its closest medoid so far.
+    closest = np.full(len(encodings), np.inf)
+    for _ in range(MAX_MEDOIDS):
+        cost = np.minimum(closest[None, :], distances).sum(axis=1)
+        medoid = int(cost.argmin())
+        closest = np.minimum(closest, distances[medoid])
+        rows.append(encodings[medoid])
+    return np.vstack(rows)
+
+
+class MatchResult:
+    """Per-face outcome of matching a batch of encodings against a gallery.
+
+    Row ``f`` describes face ``f``: ``candidates[f]`` are its nearest students
+    (None where the gallery has fewer than top_k), ``distances[f]`` their
+    distances in ascending order (inf padded) and ``margins[f]`` the gap
+    between the first and second. A face is accepted when its best distance
+    is within ``tolerance`` and its margin is at least ``min_margin``.
+    """
+
+    def __init__(self, encodings, candidates, distances, tolerance, min_margin=0.0):
+        self.encodings = encodings
+        self.candidates = candidates
+        self.distances = distances
+        self.tolerance = tolerance
+        self.min_margin = min_margin
+        self.evaluate()
+
+    def __len__(self):
+        return len(self.distances)
+
+    def evaluate(self):
+        # Threshold and margin checks for every face in one pass
+        if self.distances.shape[1] > 1:
+            with np.errstate(invalid='ignore'):  # inf - inf for faces without candidates
+                self.margins = self.distances[:, 1] - self.distances[:, 0]
+        else:
+            self.margins = np.full(len(self), np.inf)
+        self.accepted = (self.distances[:, 0] <= self.tolerance) & (self.margins >= self.min_margin)
+
+    @property
+    def students(self):
+        return {self.candidates[face, 0] for face in np.flatnonzero(self.accepted)}
+
+    @property
+    def unmatched(self):
+        return np.flatnonzero(~self.accepted)
+
+    def replace(self, faces, other):
+        """Take the rows ``faces`` from ``other``, the same faces matched against another gallery."""
+        self.candidates[faces] = other.candidates
+        self.distances[faces] = other.distances
+        self.evaluate()
+
+    def faces(self):
+        """JSON-friendly per-face summary for API responses.
+
+        Only accepted faces are named; the runner-up candidates stay in
+        RecognitionLog, since the upload endpoints are public.
+        """
+        return [
+            {
+                "student": candidates[0].name if accepted else None,
+                "distance": round(float(distances[0]), 4) if np.isfinite(distances[0]) else None,
+                "margin": round(float(margin), 4) if np.isfinite(margin) else None,
+            }
+            for candidates, distances, margin, accepted in zip(
+                self.candidates, self.distances, self.margins, self.accepted
+            )
+        ]
+
+
+class Gallery:
+    """Known students with a compact hot-path encoding matrix.
+
+    ``encoding_sets[i]`` holds every enrolled encoding of ``students[i]``; the
+    hot path only sees their centroid/medoids (a few rows per student) and the
+    full sets are consulted for faces close to the threshold.
+    """
+
+    def __init__(self, students, encoding_sets, compact_sets=None):
+        self.students = list(students)
+        self.encoding_sets = [np.asarray(e, dtype=np.float64).reshape(-1, ENCODING_SIZE) for e in encoding_sets]
+        if compact_sets is None:
+            compact_sets = [compact_encodings(e) for e in self.encoding_sets]
+        self.compact_sets = compact_sets
+        self.index = {student.id: i for i, student in enumerate(self.students)}
+        # Object array so top-k candidate rows can be gathered with fancy indexing
+        self.student_array = np.empty(len(self.students), dtype=object)
+        self.student_array[:] = self.students
+
+        self.encodings = np.vstack(compact_sets) if compact_sets else np.empty((0, ENCODING_SIZE))
+        # First row of each student in self.encodings, for np.minimum.reduceat
+        self.offsets = np.cumsum([0] + [len(rows) for rows in compact_sets[:-1]]).astype(np.intp)
+        self.squared_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+        # Farthest any full encoding lies from its nearest compact row. By the
+        # triangle inequality no full encoding of a student is closer to a face
+        # than its compact distance minus this radius.
+        self.radii = np.array([
+            _pairwise_distances(full, compact).min(axis=1).max()
+            for full, compact in zip(self.encoding_sets, compact_sets)
+        ])
+
+    def __len__(self):
+        return len(self.students)
+
+    def subset(self, student_ids):
+        rows = sorted(self.index[student_id] for student_id in student_ids if student_id in self.index)
+        return Gallery(
+            [self.students[row] for row in rows],
+            [self.encoding_sets[row] for row in rows],
+            [self.compact_sets[row] for row in rows],
+        )
+
+    def distances(self, encodings):
+        """Distance from every face (rows) to the closest compact row of every student (columns)."""
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        squared = (
+            np.einsum('ij,ij->i', encodings, encodings)[:, None]
+            + self.squared_norms[None, :]
+            - 2.0 * encodings @ self.encodings.T
+        )
+        distances = np.sqrt(np.maximum(squared, 0.0))
+        return np.minimum.reduceat(distances, self.offsets, axis=1)
+
+    def rerank(self, encoding, distances):
+        """Refine one face's distance row in place with the full encoding sets of its top candidates."""
+        for candidate in np.argsort(distances - self.radii)[:RERANK_CANDIDATES]:
+            distances[candidate] = np.linalg.norm(self.encoding_sets[candidate] - encoding, axis=1).min()
+        return distances
+
+    def match(self, encodings, tolerance, top_k=TOP_K, min_margin=0.0):
+        """Return a MatchResult with the top_k nearest students of every face."""
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        candidates = np.full((len(encodings), top_k), None, dtype=object)
+        distances = np.full((len(encodings), top_k), np.inf)
+        if len(encodings) and len(self):
+            matrix = self.distances(encodings)
+            # Not clearly accepted, but a full encoding may still be within tolerance
+            near = (
+                (matrix.min(axis=1) > tolerance - RERANK_MARGIN)
+                & ((matrix - self.radii).min(axis=1) <= tolerance + RERANK_MARGIN)
+            )
+            for face in np.flatnonzero(near):
+                self.rerank(encodings[face], matrix[face])
+
+            width = min(top_k, len(self))
+            top = np.argpartition(matrix, width - 1, axis=1)[:, :width]
+            top = np.take_along_axis(top, np.take_along_axis(matrix, top, axis=1).argsort(axis=1), axis=1)
+            candidates[:, :width] = self.student_array[top]
+            distances[:, :width] = np.take_along_axis(matrix, top, axis=1)
+        return MatchResult(encodings, candidates, distances, tolerance, min_margin)
+
+
+def _load_encoding(value, owner):
+    try:
+        return np.array(json.loads(value), dtype=np.float64).reshape(ENCODING_SIZE)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Invalid encoding for {owner}: {str(e)}")
+        return None
+
+
+def _build_global_gallery():
+    encoding_sets = defaultdict(list)
+    extra = FaceEncoding.objects.exclude(encoding__isnull=True).values_list('student_id', 'encoding')
+    for student_id, value in extra:
+        encoding = _load_encoding(value, f"face encoding of student {student_id}")
+        if encoding is not None:
+            encoding_sets[student_id].append(encoding)
+
+    # A join rather than id__in, which binds one parameter per student
+    students = Student.objects.filter(
+        Q(face_encoding__isnull=False) | Q(face_encodings__encoding__isnull=False)
+    ).distinct().only('id', 'name', 'face_encoding')
+    mapping = []
+    for student in students:
+        if student.face_encoding:
+            encoding = _load_encoding(student.face_encoding, f"student {student.id}")
+            if encoding is not None:
+                encoding_sets[student.id].insert(0, encoding)
+        if encoding_sets[student.id]:
+            mapping.append(student)
+
+    logger.info("Loaded and cached face encodings")
+    return Gallery(mapping, [np.vstack(encoding_sets[student.id]) for student in mapping])
+
+
+def _cached(key, version, build):
+    cached = _galleries.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    with _galleries_lock:
+        cached = _galleries.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        gallery = build()
+        _galleries[key] = (version, gallery)
+        return gallery
+
+
+def global_gallery():
+    """Every enrolled student; rebuilt whenever a Student is saved or deleted."""
+    return _cached('global', get_version('students'), _build_global_gallery)
+
+
+def session_gallery(session):
+    """Sub-gallery of the session's roster; rebuilt when the roster or the students change.
+
+    The roster belongs to the section, so every meeting of a section shares
+    one cached sub-gallery.
+    """
+    version = (get_version('students'), get_version('rosters'))
+    gallery = global_gallery()
+
+    def build():
+        roster = session.section.students.values_list('id', flat=True)
+        logger.info(f"Built sub-gallery for section {session.section_id}")
+        return gallery.subset(roster)
+
+    return _cached(('section', session.section_id), version, build)
+
+
+def get_galleries(session_id=None):
+    """Return (gallery, fallback) for a request.
+
+    With a session, faces are matched against its roster first and only the
+    leftovers against the global gallery. Raises ClassSession.DoesNotExist or
+    ValueError for an unknown session id.
+    """
+    if not session_id:
+        return global_gallery(), None
+    session = ClassSession.objects.select_related('section').get(pk=session_id)
+    return session_gallery(session), global_gallery()
@@ -0,0 +1,54 @@
+# attendance/imaging.py
+#
+# Enrollment image pipeline: turns an uploaded profile photo of any size into
+# a small face-cropped JPEG (what gets encoded) and a list-view thumbnail.
+import cv2
+from .encoding import downscale, load_rgb
+from .face_models import face_locations
+
+
+DETECTION_DIMENSION = 800  # longest side used to find the face
+NORMALIZED_SIZE = 400  # side of the square face crop that is stored and encoded
+THUMBNAIL_SIZE = 128
+FACE_MARGIN = 0.6  # context kept around the face, as a fraction of its size
+JPEG_QUALITY = 90
+
+
+def _square_crop(image, centre_x, centre_y, side):
+    height, width = image.shape[:2]
+    side = int(min(side, width, height))
+    left = int(min(max(centre_x - side / 2, 0), width - side))
+    top = int(min(max(centre_y - side / 2, 0), height - side))
+    return image[top:top + side, left:left + side]
+
+
+def _jpeg(rgb_image, max_side):
+    image = downscale(cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR), max_side)
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise ValueError("Could not encode JPEG")
+    return buffer.tobytes()
+
+
+def normalize_enrollment_image(path):
+    """Return (normalized JPEG bytes, thumbnail JPEG bytes, whether a face was found)."""
+    rgb_image = load_rgb(path)
+    height, width = rgb_image.shape[:2]
+
+    # Find the face on a small copy, then crop the original around it
+    small = downscale(rgb_image, DETECTION_DIMENSION)
+    scale = width / small.shape[1]
+    locations = face_locations(small)
+    if not locations:
+        crop = _square_crop(rgb_image, width / 2, height / 2, min(width, height))
+        return _jpeg(rgb_image, DETECTION_DIMENSION), _jpeg(crop, THUMBNAIL_SIZE), False
+
+    top, right, bottom, left = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+    face_size = max(right - left, bottom - top) * scale
+    crop = _square_crop(
+        rgb_image,
+        (left + right) / 2 * scale,
+        (top + bottom) / 2 * scale,
+        face_size * (1 + 2 * FACE_MARGIN),
+    )
+    return _jpeg(crop, NORMALIZED_SIZE), _jpeg(crop, THUMBNAIL_SIZE), True
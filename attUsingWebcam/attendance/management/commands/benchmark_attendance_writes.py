@@ -0,0 +1,120 @@
+# attendance/management/commands/benchmark_attendance_writes.py
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from attendance.models import Attendance, Student
+from attendance.recognition import create_attendance_records
+
+
+class Command(BaseCommand):
+    help = ("Simulate many concurrent attendance uploads against a temporary copy of the SQLite "
+            "database, writing directly and through the single-writer queue.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help="Concurrent uploads")
+        parser.add_argument('--uploads', type=int, default=400)
+        parser.add_argument('--students', type=int, default=2000, help="Temporary students to create")
+        parser.add_argument('--per-upload', type=int, default=30, help="Students recognized per upload")
+        parser.add_argument('--database', help="Copy the project database here and benchmark the copy "
+                                               "(default: a temporary file that is removed afterwards)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite' or str(connection.settings_dict['NAME']) == ':memory:':
+            raise CommandError("This benchmark is meant for a file-backed SQLite database.")
+
+        workdir = None if options['database'] else tempfile.mkdtemp(prefix='attendance-bench-')
+        path = options['database'] or os.path.join(workdir, 'db.sqlite3')
+        try:
+            self.use_copy(path)
+            self.benchmark(options)
+        finally:
+            connection.close()
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    @staticmethod
+    def use_copy(path):
+        """Snapshot the configured database to ``path`` and point every new connection at it."""
+        live = str(connection.settings_dict['NAME'])
+        if os.path.abspath(path) == os.path.abspath(live):
+            raise CommandError("--database must not be the live database.")
+        connection.close()
+        # The backup API gives a consistent copy even while the server is writing
+        source, target = sqlite3.connect(live), sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        # Connections of the worker threads (and the write queue) are created
+        # from this dict, so they all open the copy.
+        settings.DATABASES['default']['NAME'] = path
+        connection.settings_dict['NAME'] = path
+        # Bring the copy's schema up to date with the code being benchmarked
+        call_command('migrate', verbosity=0)
+
+    def benchmark(self, options):
+        self.stdout.write(
+            f"database={connection.settings_dict['NAME']} journal_mode={self.pragma('journal_mode')} "
+            f"synchronous={self.pragma('synchronous')} busy_timeout={self.pragma('busy_timeout')}ms"
+        )
+
+        # Students are bulk-created in the copy only (no signals, no gallery
+        # version bumps) and vanish with it.
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        Student.objects.bulk_create([
+            Student(name=f"{prefix}-{i}", student_id=f"{prefix}-{i}", phone='0',
+                    email=f"{prefix}-{i}@example.invalid", profile_image='')
+            for i in range(options['students'])
+        ])
+        students = list(Student.objects.filter(student_id__startswith=prefix).only('id'))
+        self.stdout.write(f"{'mode':<8} {'uploads/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'rows':>6} {'dupes':>6}")
+        for queued in (False, True):
+            self.run(students, queued, options)
+            Attendance.objects.filter(student__in=students).delete()
+
+    def run(self, students, queued, options):
+        rng = random.Random(0)
+        uploads = [rng.sample(students, min(options['per_upload'], len(students))) for _ in range(options['uploads'])]
+
+        def upload(recognized):
+            start = time.perf_counter()
+            try:
+                create_attendance_records(recognized, queued=queued)
+                return time.perf_counter() - start, None
+            except OperationalError as e:
+                return time.perf_counter() - start, e
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(upload, uploads))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, error in results)
+        errors = sum(1 for latency, error in results if error is not None)
+        rows = Attendance.objects.filter(student__in=students).values_list('student_id', 'date')
+        per_day = Counter(rows)
+        mode = 'queued' if queued else 'direct'
+        self.stdout.write(
+            f"{mode:<8} {len(uploads) / elapsed:>10.1f} {latencies[len(latencies) // 2] * 1000:>8.1f} "
+            f"{latencies[int(len(latencies) * 0.95)] * 1000:>8.1f} {errors:>7} {len(per_day):>6} "
+            f"{sum(per_day.values()) - len(per_day):>6}"
+        )
+
+    @staticmethod
+    def pragma(name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
@@ -0,0 +1,55 @@
+# attendance/management/commands/benchmark_decoders.py
+import time
+import face_recognition
+from django.core.management.base import BaseCommand, CommandError
+from attendance.video_decoders import DECODERS, available_decoders, get_decoder
+
+
+class Command(BaseCommand):
+    help = "Compare the video decoder backends (normal and keyframe-only fast mode) on a sample video."
+
+    def add_arguments(self, parser):
+        parser.add_argument('video', help="Path to the video file to decode")
+        parser.add_argument('--frame-skip', type=int, default=5)
+        parser.add_argument('--target-width', type=int, default=640)
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per configuration; the best one is reported")
+        parser.add_argument('--detect', action='store_true', help="Also run HOG face detection on every sampled frame")
+
+    def handle(self, *args, **options):
+        rows = []
+        for name in available_decoders():
+            # Fast mode on a backend that cannot skip non-keyframes is just normal
+            # decoding (and rejected by the upload API), so it is not compared.
+            for fast in (False, True) if DECODERS[name].keyframes else (False,):
+                try:
+                    rows.append(self.run(name, fast, options))
+                except ValueError as e:
+                    raise CommandError(str(e))
+
+        baseline = rows[0]['seconds']
+        self.stdout.write(f"{'decoder':<10} {'mode':<7} {'frames':>7} {'faces':>6} {'seconds':>8} {'frames/s':>9} {'speedup':>8}")
+        for row in rows:
+            fps = row['frames'] / row['seconds'] if row['seconds'] else 0.0
+            speedup = baseline / row['seconds'] if row['seconds'] else 0.0
+            faces = row['faces'] if options['detect'] else '-'
+            self.stdout.write(
+                f"{row['decoder']:<10} {row['mode']:<7} {row['frames']:>7} {faces:>6} "
+                f"{row['seconds']:>8.3f} {fps:>9.1f} {speedup:>7.2f}x"
+            )
+
+    def run(self, name, fast, options):
+        best = None
+        for _ in range(max(1, options['repeat'])):
+            frames = faces = 0
+            start = time.perf_counter()
+            with get_decoder(name, options['video'], frame_skip=options['frame_skip'],
+                             target_width=options['target_width'], keyframes_only=fast) as video:
+                for frame_index, seconds, rgb_frame in video.frames():
+                    frames += 1
+                    if options['detect']:
+                        faces += len(face_recognition.face_locations(rgb_frame, model="hog"))
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best['seconds']:
+                best = {'decoder': name, 'mode': 'fast' if fast else 'normal',
+                        'frames': frames, 'faces': faces, 'seconds': elapsed}
+        return best
@@ -0,0 +1,21 @@
+# attendance/management/commands/normalize_profile_images.py
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from attendance.models import Student
+
+
+class Command(BaseCommand):
+    help = ("Create the face-cropped normalized image and thumbnail for students enrolled before "
+            "the image pipeline existed, and re-encode them from the normalized copy.")
+
+    def handle(self, *args, **options):
+        students = Student.objects.exclude(profile_image='').filter(
+            Q(normalized_image__isnull=True) | Q(normalized_image='')
+        ).order_by('pk')
+        total = students.count()
+        for count, student in enumerate(students.iterator(), start=1):
+            # Clearing the encoding makes save() recompute it from the new normalized image
+            student.face_encoding = None
+            student.save()
+            self.stdout.write(f"{count}/{total} {student.name}: {student.thumbnail.name or 'failed'}")
+        self.stdout.write(self.style.SUCCESS(f"Normalized {total} profile images"))
@@ -0,0 +1,137 @@
+# attendance/management/commands/reencode_faces.py
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from attendance.encoding import ENROLLMENT_DIMENSION, encode_task
+from attendance.models import FaceEncoding, Student
+from attendance.versions import bump_version
+
+
+# target name -> (model, image fields in order of preference, encoding field)
+TARGETS = {
+    'students': (Student, ('normalized_image', 'profile_image'), 'face_encoding'),
+    'face-encodings': (FaceEncoding, ('image',), 'encoding'),
+}
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored face encodings of every enrollment image across a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=[*TARGETS, 'all'], default='all')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=200, help="Rows written per bulk_update transaction")
+        parser.add_argument('--max-dimension', type=int, default=ENROLLMENT_DIMENSION,
+                            help="Downscale images so the longest side is at most this many pixels (0 keeps full size)")
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'var', 'reencode_checkpoint.json'))
+        parser.add_argument('--resume', action='store_true', help="Continue after the last checkpointed row")
+
+    def handle(self, *args, **options):
+        checkpoint = self.load_checkpoint(options['checkpoint']) if options['resume'] else {}
+        if checkpoint.get('max_dimension', options['max_dimension']) != options['max_dimension']:
+            raise CommandError("The checkpoint was written with a different --max-dimension; start over without --resume.")
+        checkpoint['max_dimension'] = options['max_dimension']
+
+        targets = list(TARGETS) if options['target'] == 'all' else [options['target']]
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for target in targets:
+                self.reencode(target, pool, checkpoint, options)
+
+        # Everything finished; the next run starts from scratch
+        if os.path.exists(options['checkpoint']):
+            os.unlink(options['checkpoint'])
+
+    def reencode(self, target, pool, checkpoint, options):
+        model, image_fields, encoding_field = TARGETS[target]
+        storage = model._meta.get_field(image_fields[0]).storage
+        last_pk = checkpoint.get(target, 0)
+        # First non-empty image field of each row (e.g. the small normalized copy over the original)
+        rows = [
+            (pk, next(name for name in names if name))
+            for pk, *names in model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', *image_fields)
+            if any(names)
+        ]
+        if not rows:
+            self.stdout.write(f"{target}: nothing to do")
+            return
+        if last_pk:
+            self.stdout.write(f"{target}: resuming after pk {last_pk}")
+
+        max_dimension = options['max_dimension'] or None
+        tasks = [(pk, storage.path(name), max_dimension) for pk, name in rows]
+        chunksize = max(1, min(16, len(tasks) // (4 * (options['workers'] or 1))))
+
+        processed = done = 0
+        cleared = []  # no face found: the old encoding is removed
+        errors = []  # unreadable image: the row is left as it was
+        batch = []
+        start = time.perf_counter()
+        # map() yields in submission (pk) order, so a flushed batch always
+        # covers every row up to its last pk and is a valid resume point.
+        for pk, encoding, error in pool.map(encode_task, tasks, chunksize=chunksize):
+            processed += 1
+            if error is not None:
+                # A missing file or unmounted media volume says nothing about the face
+                errors.append(pk)
+                self.stderr.write(f"{target} {pk}: {error}")
+            else:
+                if encoding is None:
+                    # Clear the old encoding rather than mix vectors from two models/pipelines
+                    cleared.append(pk)
+                    self.stderr.write(f"{target} {pk}: no face found")
+                else:
+                    done += 1
+                batch.append(model(pk=pk, **{encoding_field: encoding}))
+            if processed % options['batch_size'] == 0 or processed == len(tasks):
+                self.flush(model, encoding_field, batch)
+                batch = []
+                checkpoint[target] = pk
+                self.save_checkpoint(options['checkpoint'], checkpoint)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"{target}: {processed}/{len(tasks)} images, {processed / elapsed:.1f} images/s")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"{target}: re-encoded {done} of {processed} images in {elapsed:.1f}s "
+            f"({processed / elapsed:.1f} images/s, {len(cleared)} without a face, {len(errors)} failed)"
+        ))
+        if cleared:
+            self.stdout.write(
+                f"{target}: encodings cleared for pks {', '.join(map(str, cleared))}; "
+                "replace their images and run again"
+            )
+        if errors:
+            self.stdout.write(
+                f"{target}: could not read the images of pks {', '.join(map(str, errors))}; "
+                "their encodings were left unchanged"
+            )
+
+    @staticmethod
+    def flush(model, encoding_field, batch):
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_update(batch, [encoding_field])
+        # bulk_update sends no post_save, so invalidate the galleries here
+        bump_version('students')
+
+    @staticmethod
+    def load_checkpoint(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            raise CommandError(f"Unreadable checkpoint {path}: {e}")
+
+    @staticmethod
+    def save_checkpoint(path, checkpoint):
+        # Write then rename so an interrupted run never leaves a half-written file
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(f"{path}.tmp", path)
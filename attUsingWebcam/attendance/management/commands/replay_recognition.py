@@ -0,0 +1,356 @@
+# attendance/management/commands/replay_recognition.py
+import os
+import csv
+import json
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from attendance.gallery import ENCODING_SIZE, Gallery, global_gallery
+from attendance.models import RecognitionLog, Student
+from attendance.recognition import FRAME_SKIP, decode_image, detect_and_encode
+from attendance.video_decoders import available_decoders, get_decoder
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+DEFAULT_FRAME_SKIPS = (1, 2, 5, 10, 15, 30)
+# Faces matched per distance matrix, so memory stays bounded on large corpora
+CHUNK_SIZE = 4096
+
+
+def corpus_files(paths):
+    """Expand directories into the images and videos they contain, in a stable order."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(root, name) for name in names
+                    if name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)
+                )
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+class Corpus:
+    """Columnar face encodings of a set of images/videos, one row per detected face.
+
+    Faces point at their frame (``face_frame``), frames at their file
+    (``frame_file``); ``frame_cost`` is the detect+encode time of each frame so
+    the cost of a sampling rate can be estimated without running it.
+    """
+
+    def __init__(self):
+        self.files, self.kinds = [], []
+        self.frame_file, self.frame_index, self.frame_seconds, self.frame_cost = [], [], [], []
+        self.face_frame, self.encodings = [], []
+
+    def add_frame(self, file, frame_index, seconds, cost, encodings):
+        frame = len(self.frame_file)
+        self.frame_file.append(file)
+        self.frame_index.append(frame_index)
+        self.frame_seconds.append(seconds)
+        self.frame_cost.append(cost)
+        self.face_frame.extend([frame] * len(encodings))
+        self.encodings.extend(encodings)
+
+    def save(self, path, metadata):
+        np.savez_compressed(
+            path,
+            files=np.array(self.files, dtype=str),
+            kinds=np.array(self.kinds, dtype=str),
+            frame_file=np.array(self.frame_file, dtype=np.int32),
+            frame_index=np.array(self.frame_index, dtype=np.int32),
+            frame_seconds=np.array(self.frame_seconds, dtype=np.float32),
+            frame_cost=np.array(self.frame_cost, dtype=np.float32),
+            face_frame=np.array(self.face_frame, dtype=np.int32),
+            encodings=np.array(self.encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE),
+            metadata=np.array(json.dumps(metadata)),
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Encode a corpus of images/videos once ('extract', or 'extract-log' from RecognitionLog), "
+        "then replay matching over a grid of thresholds and frame skips ('replay')."
+    )
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+
+        extract = actions.add_parser('extract', help="Detect and encode every face of the corpus")
+        extract.add_argument('paths', nargs='+', help="Image/video files or directories")
+        extract.add_argument('--output', required=True, help="Corpus file to write (.npz)")
+        extract.add_argument('--decoder', choices=available_decoders(), default='opencv')
+        extract.add_argument('--base-skip', type=int, default=1,
+                             help="Encode every Nth video frame; replayed frame skips must be multiples of it")
+        extract.add_argument('--target-width', type=int, default=640)
+
+        extract_log = actions.add_parser('extract-log', help="Build a corpus from logged RecognitionLog encodings")
+        extract_log.add_argument('--output', required=True, help="Corpus file to write (.npz)")
+        extract_log.add_argument('--since', help="Only rows created on or after this date (YYYY-MM-DD)")
+
+        replay = actions.add_parser('replay', help="Score parameter combinations against labelled files")
+        replay.add_argument('corpus', help="Corpus file written by extract (.npz)")
+        replay.add_argument('--labels', required=True,
+                            help="JSON object mapping file name (or log batch) to the student_ids present in it")
+        replay.add_argument('--thresholds', type=float, nargs='+',
+                            default=[0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65])
+        replay.add_argument('--frame-skips', type=int, nargs='+',
+                            help="Default: those of 1 2 5 10 15 30 that are multiples of the corpus base skip")
+        replay.add_argument('--min-margins', type=float, nargs='+', default=[0.0])
+        replay.add_argument('--min-votes', type=int, nargs='+', default=[1],
+                            help="Sampled frames a student must be matched in to count as present in a video "
+                                 "(an image needs one match, like the image endpoint)")
+        replay.add_argument('--csv', help="Also write the table to this CSV file")
+
+    def handle(self, *args, **options):
+        getattr(self, options['action'].replace('-', '_'))(options)
+
+    def extract(self, options):
+        corpus = Corpus()
+        files = corpus_files(options['paths'])
+        if not files:
+            raise CommandError("No images or videos found.")
+
+        start = time.perf_counter()
+        for file, path in enumerate(files):
+            frames, faces = len(corpus.frame_file), len(corpus.encodings)
+            video = path.lower().endswith(VIDEO_EXTENSIONS)
+            corpus.files.append(path)
+            corpus.kinds.append('video' if video else 'image')
+            try:
+                if video:
+                    self.extract_video(corpus, file, path, options)
+                else:
+                    self.extract_image(corpus, file, path)
+            except ValueError as e:
+                self.stderr.write(f"{path}: {e}")
+                continue
+            self.stdout.write(f"{path}: {len(corpus.frame_file) - frames} frames, {len(corpus.encodings) - faces} faces")
+
+        corpus.save(options['output'], {
+            'source': 'files',
+            'created_at': timezone.now().isoformat(),
+            'decoder': options['decoder'],
+            'base_skip': options['base_skip'],
+            'target_width': options['target_width'],
+        })
+        self.stdout.write(self.style.SUCCESS(
+            f"Encoded {len(corpus.encodings)} faces in {len(corpus.frame_file)} frames of {len(files)} files "
+            f"in {time.perf_counter() - start:.1f}s -> {options['output']}"
+        ))
+
+    @staticmethod
+    def extract_image(corpus, file, path):
+        with open(path, 'rb') as f:
+            rgb_image = decode_image(f.read())
+        start = time.perf_counter()
+        encodings = detect_and_encode(rgb_image)
+        corpus.add_frame(file, 0, 0.0, time.perf_counter() - start, encodings)
+
+    @staticmethod
+    def extract_video(corpus, file, path, options):
+        with get_decoder(options['decoder'], path, frame_skip=options['base_skip'],
+                         target_width=options['target_width']) as video:
+            for frame_index, seconds, rgb_frame in video.frames():
+                start = time.perf_counter()
+                encodings = detect_and_encode(rgb_frame)
+                corpus.add_frame(file, frame_index, seconds, time.perf_counter() - start, encodings)
+
+    def extract_log(self, options):
+        rows = RecognitionLog.objects.exclude(encoding__isnull=True)
+        if options['since']:
+            rows = rows.filter(created_at__date__gte=options['since'])
+
+        corpus = Corpus()
+        files, frames = {}, {}
+        for batch, source, frame_index, seconds, encoding in rows.order_by('batch', 'frame_index', 'pk').values_list(
+            'batch', 'source', 'frame_index', 'seconds', 'encoding'
+        ):
+            if str(batch) not in files:
+                files[str(batch)] = len(corpus.files)
+                corpus.files.append(str(batch))
+                corpus.kinds.append(source)
+            file = files[str(batch)]
+            key = (file, frame_index)
+            if key not in frames:
+                frames[key] = len(corpus.frame_file)
+                corpus.add_frame(file, frame_index or 0, seconds or 0.0, 0.0, [])
+            corpus.face_frame.append(frames[key])
+            corpus.encodings.append(np.frombuffer(bytes(encoding), dtype=np.float32))
+
+        if not corpus.encodings:
+            raise CommandError("No logged encodings to extract.")
+        corpus.save(options['output'], {
+            'source': 'recognition_log',
+            'created_at': timezone.now().isoformat(),
+            # Logged video frames were sampled by scan_video, paced by the
+            # processing budget and only logged when they contained faces:
+            # frame counts and detection costs are unknown.
+            'base_skip': FRAME_SKIP,
+            'frames_complete': False,
+        })
+        self.stdout.write(self.style.SUCCESS(
+            f"Extracted {len(corpus.encodings)} logged faces of {len(corpus.files)} uploads -> {options['output']}"
+        ))
+
+    def replay(self, options):
+        try:
+            data = np.load(options['corpus'])
+            with open(options['labels']) as f:
+                labels = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        metadata = json.loads(str(data['metadata']))
+        files = [str(path) for path in data['files']]
+        kinds = data['kinds']
+        face_frame = data['face_frame']
+        frame_file, frame_index, frame_cost = data['frame_file'], data['frame_index'], data['frame_cost']
+        face_file = frame_file[face_frame]
+
+        start = time.perf_counter()
+        # Exact distances: the full encoding sets serve as the "compact" rows
+        current = global_gallery()
+        gallery = Gallery(current.students, current.encoding_sets, current.encoding_sets)
+        if not len(gallery):
+            raise CommandError("No enrolled students to match against.")
+        student_ids = dict(Student.objects.filter(pk__in=gallery.index).values_list('pk', 'student_id'))
+        columns = {student_ids[student.id]: column for column, student in enumerate(gallery.students)}
+
+        # Labelled files and the (file, student) pairs that are really present
+        labelled = np.zeros(len(files), dtype=bool)
+        truth = np.zeros((len(files), len(gallery)), dtype=bool)
+        for file, path in enumerate(files):
+            present = labels.get(os.path.basename(path), labels.get(path))
+            if present is None:
+                continue
+            labelled[file] = True
+            present = [str(student_id) for student_id in present]
+            unknown = [student_id for student_id in present if student_id not in columns]
+            if unknown:
+                self.stderr.write(f"{path}: labelled students not in the gallery: {', '.join(unknown)}")
+            truth[file, [columns[student_id] for student_id in present if student_id in columns]] = True
+        if not labelled.any():
+            raise CommandError("None of the corpus files has labels.")
+
+        best, best_distances, margins = self.match(gallery, data['encodings'])
+
+        # Votes are counted per (file, student) pair of each face's best match
+        pair_keys, pair_of_face = np.unique(face_file.astype(np.int64) * len(gallery) + best, return_inverse=True)
+        pair_file, pair_student = np.divmod(pair_keys, len(gallery))
+        pair_truth = truth[pair_file, pair_student]
+        pair_labelled = labelled[pair_file]
+        pair_is_image = kinds[pair_file] == 'image'
+        positives = int(truth[labelled].sum())
+
+        thresholds = np.array(options['thresholds'])
+        min_margins = np.array(options['min_margins'])
+        min_votes = np.array(options['min_votes'])
+        base_skip = metadata.get('base_skip', 1)
+        if not options['frame_skips']:
+            options['frame_skips'] = [skip for skip in DEFAULT_FRAME_SKIPS if skip % base_skip == 0]
+        invalid = [str(frame_skip) for frame_skip in options['frame_skips'] if frame_skip % base_skip]
+        if invalid:
+            raise CommandError(
+                f"Frame skips {', '.join(invalid)} are not multiples of the corpus base skip {base_skip}."
+            )
+        frames_complete = metadata.get('frames_complete', True)
+        if not frames_complete:
+            self.stderr.write(
+                "This corpus comes from RecognitionLog: only budget-paced frames with faces were logged, "
+                "so frames and cost are not reported and larger frame skips subsample those frames."
+            )
+        is_image = kinds[frame_file] == 'image'
+
+        rows = []
+        for frame_skip in options['frame_skips']:
+            # Same sampling rule as the decoders: every frame_skip-th frame, images always
+            sampled = is_image | ((frame_index + 1) % frame_skip == 0)
+            sampled_faces = sampled[face_frame]
+            # Votes of every pair for each (threshold, margin); one O(faces) pass each
+            votes = np.array([
+                [
+                    np.bincount(
+                        pair_of_face,
+                        weights=sampled_faces & (best_distances <= threshold) & (margins >= min_margin),
+                        minlength=len(pair_keys),
+                    )
+                    for min_margin in min_margins
+                ]
+                for threshold in thresholds
+            ])
+            # An image gives each face one vote, so min_votes only applies to videos
+            needed = np.where(pair_is_image, 1, min_votes[:, None])
+            predicted = (votes[None] >= needed[:, None, None, :]) & pair_labelled
+            true_positives = (predicted & pair_truth).sum(axis=-1)
+            false_positives = (predicted & ~pair_truth).sum(axis=-1)
+
+            frames = cost = None
+            if frames_complete:
+                frames = int((sampled & labelled[frame_file]).sum())
+                cost = float(frame_cost[sampled & labelled[frame_file]].sum())
+            for v, votes_needed in enumerate(min_votes):
+                for t, threshold in enumerate(thresholds):
+                    for m, min_margin in enumerate(min_margins):
+                        tp, fp = int(true_positives[v, t, m]), int(false_positives[v, t, m])
+                        precision = tp / (tp + fp) if tp + fp else 1.0
+                        recall = tp / positives if positives else 1.0
+                        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+                        rows.append({
+                            'threshold': float(threshold), 'min_margin': float(min_margin),
+                            'frame_skip': frame_skip, 'min_votes': int(votes_needed),
+                            'precision': precision, 'recall': recall, 'f1': f1,
+                            'true_positives': tp, 'false_positives': fp, 'false_negatives': positives - tp,
+                            'frames': frames, 'cost_seconds': cost,
+                        })
+
+        elapsed = time.perf_counter() - start
+        self.write_table(rows)
+        if options['csv']:
+            with open(options['csv'], 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+                writer.writeheader()
+                writer.writerows(rows)
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {len(rows)} configurations over {len(best)} faces ({int(labelled.sum())} labelled files) "
+            f"in {elapsed:.2f}s"
+        ))
+
+    @staticmethod
+    def match(gallery, encodings):
+        """Best student, its distance and the margin to the runner-up for every face, in chunks."""
+        best = np.empty(len(encodings), dtype=np.int64)
+        best_distances = np.empty(len(encodings))
+        margins = np.full(len(encodings), np.inf)
+        for start in range(0, len(encodings), CHUNK_SIZE):
+            rows = slice(start, start + CHUNK_SIZE)
+            matrix = gallery.distances(encodings[rows])
+            faces = np.arange(len(matrix))
+            if len(gallery) > 1:
+                top = np.argpartition(matrix, 1, axis=1)[:, :2]
+                swap = matrix[faces, top[:, 1]] < matrix[faces, top[:, 0]]
+                top[swap] = top[swap][:, ::-1]
+                margins[rows] = matrix[faces, top[:, 1]] - matrix[faces, top[:, 0]]
+            else:
+                top = np.zeros((len(matrix), 1), dtype=np.int64)
+            best[rows] = top[:, 0]
+            best_distances[rows] = matrix[faces, top[:, 0]]
+        return best, best_distances, margins
+
+    def write_table(self, rows):
+        self.stdout.write(
+            f"{'threshold':>9} {'margin':>6} {'skip':>4} {'votes':>5} {'precision':>9} {'recall':>6} {'f1':>5} "
+            f"{'tp':>5} {'fp':>5} {'fn':>5} {'frames':>7} {'cost s':>8}"
+        )
+        for row in rows:
+            frames = '-' if row['frames'] is None else row['frames']
+            cost = '-' if row['cost_seconds'] is None else f"{row['cost_seconds']:.2f}"
+            self.stdout.write(
+                f"{row['threshold']:>9.3f} {row['min_margin']:>6.3f} {row['frame_skip']:>4} {row['min_votes']:>5} "
+                f"{row['precision']:>9.3f} {row['recall']:>6.3f} {row['f1']:>5.3f} "
+                f"{row['true_positives']:>5} {row['false_positives']:>5} {row['false_negatives']:>5} "
+                f"{frames:>7} {cost:>8}"
+            )
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Camera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('roi_polygons', models.JSONField(blank=True, default=list)),
+                ('frame_width', models.PositiveIntegerField(blank=True, null=True)),
+                ('frame_height', models.PositiveIntegerField(blank=True, null=True)),
+                ('min_face_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_face_size', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0003_course_section_classsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceEncoding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='enrollment_images/')),
+                ('encoding', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_encodings', to='attendance.student')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_faceencoding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='normalized_image',
+            field=models.ImageField(blank=True, null=True, upload_to='derived/normalized/'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='derived/thumbnails/'),
+        ),
+    ]
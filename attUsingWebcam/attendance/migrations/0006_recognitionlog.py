@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0005_student_normalized_image_student_thumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecognitionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.UUIDField(db_index=True)),
+                ('source', models.CharField(choices=[('image', 'Image'), ('video', 'Video')], max_length=5)),
+                ('frame_index', models.PositiveIntegerField(blank=True, null=True)),
+                ('seconds', models.FloatField(blank=True, null=True)),
+                ('candidate_ids', models.JSONField(default=list)),
+                ('distances', models.JSONField(default=list)),
+                ('margin', models.FloatField(blank=True, null=True)),
+                ('tolerance', models.FloatField()),
+                ('accepted', models.BooleanField()),
+                ('encoding', models.BinaryField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('camera', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='attendance.camera')),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='attendance.classsession')),
+            ],
+        ),
+    ]
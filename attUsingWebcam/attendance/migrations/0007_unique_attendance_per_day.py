@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:22
+
+from django.db import migrations, models
+
+
+def remove_duplicate_attendance(apps, schema_editor):
+    # Concurrent uploads could record a student twice on the same day; keep
+    # the earliest row so the constraint below can be created.
+    Attendance = apps.get_model('attendance', 'Attendance')
+    first_ids = Attendance.objects.values('student', 'date').annotate(first_id=models.Min('id')).values('first_id')
+    Attendance.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0006_recognitionlog'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_attendance, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('student', 'date'), name='unique_attendance_per_day'),
+        ),
+    ]
@@ -1,7 +1,38 @@
+import hashlib
+import logging
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
 from django.db import models
-import face_recognition
-import json
-import numpy as np
+from .encoding import ENROLLMENT_DIMENSION, encode_image_file
+from .imaging import normalize_enrollment_image
+
+
+logger = logging.getLogger(__name__)
+
+
+def content_hashed_name(data, extension='jpg'):
+    return f"{hashlib.sha1(data).hexdigest()[:20]}.{extension}"
+
+
+def store_derived(field_file, data):
+    """Point ``field_file`` at the content-hashed file for ``data``, writing it only if it is new."""
+    name = field_file.field.generate_filename(field_file.instance, content_hashed_name(data))
+    if field_file.storage.exists(name):
+        field_file.name = name
+    else:
+        field_file.save(content_hashed_name(data), ContentFile(data), save=False)
+
+
+def delete_unreferenced_derived(names):
+    """Delete derived image files no student points at any more.
+
+    Names are content hashes, so two students with the same photo share a
+    file; it is only removed once neither references it.
+    """
+    storage = Student._meta.get_field('thumbnail').storage
+    for name in filter(None, names):
+        if not Student.objects.filter(models.Q(normalized_image=name) | models.Q(thumbnail=name)).exists():
+            storage.delete(name)
 
 class Student(models.Model):
     name = models.CharField(max_length=100)
@@ -10,29 +41,165 @@ class Student(models.Model):
     email = models.EmailField(unique=True)
     profile_image = models.ImageField(upload_to='profile_images/')
     face_encoding = models.TextField(blank=True, null=True)  # stored as a JSON list
+    # Derived from profile_image on save; content-hashed names so they can be cached forever
+    normalized_image = models.ImageField(upload_to='derived/normalized/', blank=True, null=True)
+    thumbnail = models.ImageField(upload_to='derived/thumbnails/', blank=True, null=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored photo so save() can tell when it was replaced
+        if 'profile_image' in field_names:
+            instance._saved_profile_image = values[field_names.index('profile_image')]
+        return instance
 
     def save(self, *args, **kwargs):
+        # A new photo invalidates everything derived from the old one.
+        saved_profile_image = getattr(self, '_saved_profile_image', None)
+        replaced_derived = []
+        if saved_profile_image is not None and self.profile_image.name != saved_profile_image:
+            replaced_derived = [self.normalized_image.name, self.thumbnail.name]
+            self.normalized_image = self.thumbnail = None
+            self.face_encoding = None
         # Save first to ensure profile_image file exists.
         super().save(*args, **kwargs)
-        # If the face encoding is not yet set, compute it.
-        if self.profile_image and not self.face_encoding:
+        self._saved_profile_image = self.profile_image.name
+        delete_unreferenced_derived(replaced_derived)
+
+        # Produce the face-cropped image and thumbnail once per upload.
+        has_face = None
+        if self.profile_image and not self.normalized_image:
             try:
-                image = face_recognition.load_image_file(self.profile_image.path)
-                encodings = face_recognition.face_encodings(image)
-                if encodings:
-                    encoding = encodings[0]
-                    self.face_encoding = json.dumps(encoding.tolist())
+                normalized, thumbnail, has_face = normalize_enrollment_image(self.profile_image.path)
+                store_derived(self.normalized_image, normalized)
+                store_derived(self.thumbnail, thumbnail)
+                super().save(update_fields=['normalized_image', 'thumbnail'])
+            except Exception as e:
+                logger.warning(f"Error normalizing profile image for {self.name}: {e}")
+            if has_face is False:
+                logger.warning(f"No face found in the profile image of {self.name}")
+
+        # If the face encoding is not yet set, compute it (from the small normalized copy when possible),
+        # unless normalization just found no face in this very photo.
+        if self.profile_image and not self.face_encoding and has_face is not False:
+            try:
+                source = self.normalized_image or self.profile_image
+                self.face_encoding = encode_image_file(source.path, ENROLLMENT_DIMENSION)
+                if self.face_encoding:
                     super().save(update_fields=['face_encoding'])
             except Exception as e:
-                print(f"Error computing face encoding for {self.name}: {e}")
+                logger.warning(f"Error computing face encoding for {self.name}: {e}")
 
     def __str__(self):
         return self.name
 
+class FaceEncoding(models.Model):
+    """An extra enrollment image of a student (other lighting, angle, glasses...)."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='face_encodings')
+    image = models.ImageField(upload_to='enrollment_images/')
+    encoding = models.TextField(blank=True, null=True)  # stored as a JSON list
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.image and not self.encoding:
+            try:
+                self.encoding = encode_image_file(self.image.path, ENROLLMENT_DIMENSION)
+                if self.encoding:
+                    super().save(update_fields=['encoding'])
+            except Exception as e:
+                logger.warning(f"Error computing face encoding for {self.student}: {e}")
+
+    def __str__(self):
+        return f"{self.student} #{self.pk}"
+
+class Camera(models.Model):
+    """A fixed classroom camera and the seat regions faces can appear in."""
+    name = models.CharField(max_length=100, unique=True)
+    # List of polygons, each a list of [x, y] points in native frame pixels.
+    # Empty means the whole frame.
+    roi_polygons = models.JSONField(default=list, blank=True)
+    frame_width = models.PositiveIntegerField(blank=True, null=True)  # resolution the ROI coordinates refer to
+    frame_height = models.PositiveIntegerField(blank=True, null=True)
+    min_face_size = models.PositiveIntegerField(blank=True, null=True)  # expected face size range, native pixels
+    max_face_size = models.PositiveIntegerField(blank=True, null=True)
+
+    def clean(self):
+        from .roi import validate_polygons
+        try:
+            validate_polygons(self.roi_polygons)
+        except ValueError as e:
+            raise ValidationError({'roi_polygons': str(e)})
+        if self.min_face_size and self.max_face_size and self.min_face_size > self.max_face_size:
+            raise ValidationError({'max_face_size': "Must not be smaller than min_face_size."})
+        if self.roi_polygons and not (self.frame_width and self.frame_height):
+            raise ValidationError({'frame_width': "Set the frame size the ROI polygons were drawn on."})
+
+    def layout(self):
+        from .roi import CameraLayout
+        return CameraLayout.from_camera(self)
+
+    def __str__(self):
+        return self.name
+
+class Course(models.Model):
+    code = models.CharField(max_length=20, unique=True)
+    name = models.CharField(max_length=200)
+
+    def __str__(self):
+        return f"{self.code} - {self.name}"
+
+class Section(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='sections')
+    name = models.CharField(max_length=50)
+    students = models.ManyToManyField(Student, related_name='sections', blank=True)  # the roster
+
+    class Meta:
+        unique_together = ('course', 'name')
+
+    def __str__(self):
+        return f"{self.course.code} {self.name}"
+
+class ClassSession(models.Model):
+    """One meeting of a section; recognition is restricted to the section's roster."""
+    section = models.ForeignKey(Section, on_delete=models.CASCADE, related_name='sessions')
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.section} @ {self.starts_at:%Y-%m-%d %H:%M}"
+
 class Attendance(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     date = models.DateField(auto_now_add=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # One row per student and day, however many processes record it
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'date'], name='unique_attendance_per_day'),
+        ]
+
     def __str__(self):
         return f"{self.student.name} - {self.date}"
+
+class RecognitionLog(models.Model):
+    """One detected face and its nearest enrolled students, kept for offline threshold tuning."""
+    SOURCE_CHOICES = [('image', 'Image'), ('video', 'Video')]
+
+    batch = models.UUIDField(db_index=True)  # every face of one upload
+    source = models.CharField(max_length=5, choices=SOURCE_CHOICES)
+    session = models.ForeignKey(ClassSession, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    camera = models.ForeignKey(Camera, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    frame_index = models.PositiveIntegerField(blank=True, null=True)
+    seconds = models.FloatField(blank=True, null=True)  # position in the video
+    candidate_ids = models.JSONField(default=list)  # nearest students first
+    distances = models.JSONField(default=list)  # distance of each candidate
+    margin = models.FloatField(blank=True, null=True)  # second minus first distance
+    tolerance = models.FloatField()
+    accepted = models.BooleanField()
+    encoding = models.BinaryField(blank=True, null=True)  # float32 face encoding, to replay against new galleries
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.source} {self.batch} #{self.pk}"
@@ -0,0 +1,233 @@
+# attendance/recognition.py
+import asyncio
+import logging
+import uuid
+import cv2
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from .budget import FrameBudget
+from .completion import END_OF_VIDEO, TIME_LIMIT
+from .face_models import face_encodings, face_locations
+from .models import Attendance, RecognitionLog
+from .write_queue import attendance_write_queue
+from .video_decoders import get_decoder
+
+
+logger = logging.getLogger(__name__)
+
+# Without a camera layout whole frames are shrunk to these sizes before
+# detection; layouts detect their tiles at the same pixel density.
+VIDEO_WIDTH = 640
+IMAGE_DIMENSION = 2000
+# scan_video analyses at most every FRAME_SKIP-th video frame
+FRAME_SKIP = 5
+
+
+def decode_image(image_data, max_dimension=IMAGE_DIMENSION):
+    """Decode an uploaded image to RGB, downscaled to max_dimension (None keeps full size)."""
+    # Load image from bytes
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Invalid image file")
+
+    # Resize large images for faster processing
+    height, width = image.shape[:2]
+    if max_dimension and max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        image = cv2.resize(image, (int(width * scale), int(height * scale)))
+
+    # Convert to RGB
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def detect_and_encode(rgb_image, layout=None):
+    # With a camera layout only the seat regions are scanned, each at its own scale
+    locations = (
+        layout.face_locations(rgb_image, face_locations, IMAGE_DIMENSION) if layout else face_locations(rgb_image)
+    )
+    logger.info(f"Detected {len(locations)} faces")
+    if not locations:
+        return []
+    return face_encodings(rgb_image, locations)
+
+
+def match_faces(encodings, gallery, tolerance=None, fallback=None, top_k=None, min_margin=None):
+    """Match every encoding against the gallery and return a MatchResult.
+
+    A face is accepted when its best distance is <= tolerance and beats the
+    runner-up by at least ``min_margin``. Faces the (session) gallery cannot
+    place are retried against ``fallback``. Unset parameters come from the
+    RECOGNITION_* settings.
+    """
+    if tolerance is None:
+        tolerance = getattr(settings, 'RECOGNITION_TOLERANCE', 0.5)
+    if top_k is None:
+        top_k = getattr(settings, 'RECOGNITION_TOP_K', 3)
+    if min_margin is None:
+        min_margin = getattr(settings, 'RECOGNITION_MIN_MARGIN', 0.0)
+    result = gallery.match(encodings, tolerance, top_k=top_k, min_margin=min_margin)
+    unmatched = result.unmatched
+    if fallback is not None and len(unmatched):
+        result.replace(unmatched, fallback.match(
+            result.encodings[unmatched], tolerance, top_k=top_k, min_margin=min_margin
+        ))
+    return result
+
+
+def recognition_log(matches, source, session_id=None, camera_id=None):
+    """Unsaved RecognitionLog rows, one per face, for [(frame_index, seconds, MatchResult), ...]."""
+    batch = uuid.uuid4()
+    entries = []
+    for frame_index, seconds, result in matches:
+        distances = np.round(result.distances, 4)
+        margins = np.round(result.margins, 4)
+        encodings = result.encodings.astype(np.float32)
+        for face in range(len(result)):
+            known = [i for i, student in enumerate(result.candidates[face]) if student is not None]
+            entries.append(RecognitionLog(
+                batch=batch,
+                source=source,
+                session_id=session_id,
+                camera_id=camera_id,
+                frame_index=frame_index,
+                seconds=seconds,
+                candidate_ids=[result.candidates[face, i].id for i in known],
+                distances=distances[face, known].tolist(),
+                margin=float(margins[face]) if np.isfinite(margins[face]) else None,
+                tolerance=result.tolerance,
+                accepted=bool(result.accepted[face]),
+                encoding=encodings[face].tobytes(),
+            ))
+    return entries
+
+
+def save_recognition_log(entries):
+    if entries and getattr(settings, 'RECOGNITION_LOG', True):
+        RecognitionLog.objects.bulk_create(entries, batch_size=500)
+
+
+async def asave_recognition_log(entries):
+    if entries and getattr(settings, 'RECOGNITION_LOG', True):
+        await RecognitionLog.objects.abulk_create(entries, batch_size=500)
+
+
+class VideoScan:
+    """What scan_video recognized, why it stopped decoding and how much of the video it saw."""
+
+    def __init__(self):
+        self.students = set()
+        self.stop_reason = END_OF_VIDEO
+        self.coverage = {}
+        self.matches = []  # (frame_index, seconds, MatchResult) of every analysed frame with faces
+
+    @property
+    def partial(self):
+        return self.stop_reason == TIME_LIMIT
+
+
+def scan_video(video_path, gallery, decoder='opencv', fast=False, layout=None, fallback=None, policy=None,
+               budget_seconds=None):
+    """Recognize students in a video file without touching the database.
+
+    Analysis is paced by a FrameBudget so that ``budget_seconds`` of
+    processing are spread over the whole video rather than spent on its
+    start. ``policy`` (a CompletionPolicy) may end the scan early once the
+    expected students have been seen; the returned VideoScan says why it
+    stopped and carries the coverage metadata.
+    """
+    scan = VideoScan()
+
+    # Video processing parameters
+    frame_skip = FRAME_SKIP  # Process every 5th frame
+    # Reduced resolution; with a camera layout the ROI tiles are scaled individually instead
+    target_width = None if layout else VIDEO_WIDTH
+    if budget_seconds is None:
+        budget_seconds = getattr(settings, 'VIDEO_PROCESSING_BUDGET', 30)
+
+    # The decoder hands back frames already resized and converted to RGB
+    with get_decoder(decoder, video_path, frame_skip=frame_skip,
+                     target_width=target_width, keyframes_only=fast) as video:
+        budget = FrameBudget(budget_seconds, video.duration)
+        for frame_index, seconds, rgb_frame in video.frames():
+            analyse = budget.frame_decoded(seconds)
+            if budget.exhausted():
+                if not budget.reached_end():
+                    logger.warning(f"Processing budget exhausted at {seconds:.1f}s of video")
+                    scan.stop_reason = TIME_LIMIT
+                break
+            if not analyse:
+                continue
+
+            # Face detection
+            locations = (
+                layout.face_locations(rgb_frame, face_locations, VIDEO_WIDTH) if layout else face_locations(rgb_frame)
+            )
+
+            # Process face encodings
+            frame_students = set()
+            if locations:
+                result = match_faces(
+                    face_encodings(rgb_frame, locations), gallery, fallback=fallback
+                )
+                scan.matches.append((frame_index, seconds, result))
+                frame_students = result.students
+                scan.students |= frame_students
+            budget.frame_analysed(seconds)
+
+            stop_reason = policy.update(frame_students) if policy else None
+            if stop_reason:
+                logger.info(f"Stopped at {seconds:.1f}s of video: {stop_reason}")
+                scan.stop_reason = stop_reason
+                break
+
+    scan.coverage = budget.coverage()
+    return scan
+
+
+def _new_attendance(students, existing, today):
+    return [
+        Attendance(student=student, date=today)
+        for student in students
+        if student.id not in existing
+    ]
+
+
+def create_attendance_records(students, queued=None):
+    if queued is None:
+        queued = getattr(settings, 'ATTENDANCE_WRITE_QUEUE', False)
+    if queued:
+        # Coalesced with other requests' inserts by the single writer thread
+        attendance_write_queue.submit(students).result()
+        return
+
+    today = timezone.now().date()
+    existing = set(Attendance.objects.filter(
+        date=today,
+        student__in=students
+    ).values_list('student_id', flat=True))
+
+    new_attendance = _new_attendance(students, existing, today)
+    if new_attendance:
+        # Another worker may have recorded the same student since the check above
+        Attendance.objects.bulk_create(new_attendance, ignore_conflicts=True)
+        logger.info(f"Created {len(new_attendance)} new attendance records")
+
+
+async def acreate_attendance_records(students):
+    if getattr(settings, 'ATTENDANCE_WRITE_QUEUE', False):
+        await asyncio.wrap_future(attendance_write_queue.submit(students))
+        return
+
+    today = timezone.now().date()
+    existing = {
+        student_id async for student_id in Attendance.objects.filter(
+            date=today,
+            student__in=students
+        ).values_list('student_id', flat=True)
+    }
+
+    new_attendance = _new_attendance(students, existing, today)
+    if new_attendance:
+        await Attendance.objects.abulk_create(new_attendance, ignore_conflicts=True)
+        logger.info(f"Created {len(new_attendance)} new attendance records")
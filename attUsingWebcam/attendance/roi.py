@@ -0,0 +1,119 @@
+# attendance/roi.py
+import logging
+import cv2
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# dlib's frontal face detector scans an 80x80 window; faces smaller than that
+# are only found by upsampling, larger ones cost time for no benefit.
+HOG_WINDOW_SIZE = 80
+
+
+class CameraLayout:
+    """Seat regions and expected face sizes of a fixed camera.
+
+    Polygons and face sizes are in the camera's native pixel coordinates
+    (``frame_width`` x ``frame_height``) and are rescaled to whatever
+    resolution the frame is actually decoded at.
+    """
+
+    def __init__(self, polygons=None, frame_size=None, min_face_size=None, max_face_size=None):
+        self.polygons = [np.asarray(polygon, dtype=np.float32) for polygon in polygons or []]
+        self.frame_size = frame_size
+        self.min_face_size = min_face_size
+        self.max_face_size = max_face_size
+
+    @classmethod
+    def from_camera(cls, camera):
+        frame_size = None
+        if camera.frame_width and camera.frame_height:
+            frame_size = (camera.frame_width, camera.frame_height)
+        return cls(camera.roi_polygons, frame_size, camera.min_face_size, camera.max_face_size)
+
+    def tiles(self, image_size, max_dimension=None):
+        """Yield ``(x0, y0, x1, y1, polygon, scale)`` for every ROI in an image of ``image_size``.
+
+        ``max_dimension`` is the longest side the whole frame would have been
+        shrunk to without a layout; with no face size configured, tiles are
+        detected at that same pixel density.
+        """
+        width, height = image_size
+        ratio = width / self.frame_size[0] if self.frame_size else 1.0
+        polygons = [polygon * ratio for polygon in self.polygons] or [
+            np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32)
+        ]
+
+        # Scale each tile so the smallest expected face just fills the HOG window
+        scale = 1.0
+        if self.min_face_size:
+            scale = min(HOG_WINDOW_SIZE / (self.min_face_size * ratio), 2.0)
+        elif max_dimension:
+            scale = min(max_dimension / max(width, height), 1.0)
+        # Faces are kept when their centre is in the polygon, so let the tile
+        # extend far enough to contain the whole face.
+        padding = int(self.max_face_size * ratio / 2) if self.max_face_size else 0
+
+        for polygon in polygons:
+            x, y, w, h = cv2.boundingRect(polygon)
+            x0, y0 = max(x - padding, 0), max(y - padding, 0)
+            x1, y1 = min(x + w + padding, width), min(y + h + padding, height)
+            if x1 > x0 and y1 > y0:
+                yield x0, y0, x1, y1, polygon, scale
+
+    def face_locations(self, rgb_image, detector, max_dimension=None):
+        """Run ``detector(image, upsample)`` on each ROI tile only.
+
+        Returns css (top, right, bottom, left) boxes in ``rgb_image`` coordinates.
+        """
+        height, width = rgb_image.shape[:2]
+        ratio = width / self.frame_size[0] if self.frame_size else 1.0
+        min_size = self.min_face_size * ratio if self.min_face_size else 0
+        max_size = self.max_face_size * ratio if self.max_face_size else float('inf')
+
+        locations = []
+        for x0, y0, x1, y1, polygon, scale in self.tiles((width, height), max_dimension):
+            tile = rgb_image[y0:y1, x0:x1]
+            if scale != 1.0:
+                interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+                tile = cv2.resize(tile, None, fx=scale, fy=scale, interpolation=interpolation)
+            # Without a size hint keep face_recognition's default of one upsample
+            upsample = 0 if self.min_face_size else 1
+
+            for top, right, bottom, left in detector(np.ascontiguousarray(tile), upsample):
+                top, right = int(top / scale) + y0, int(right / scale) + x0
+                bottom, left = int(bottom / scale) + y0, int(left / scale) + x0
+                size = ((right - left) + (bottom - top)) / 2
+                centre = ((left + right) / 2, (top + bottom) / 2)
+                if not min_size <= size <= max_size:
+                    continue
+                if cv2.pointPolygonTest(polygon, centre, False) < 0:
+                    continue
+                location = (top, right, bottom, left)
+                if not any(_overlap(location, other) > 0.5 for other in locations):
+                    locations.append(location)
+        return locations
+
+
+def _overlap(a, b):
+    """Intersection over union of two css boxes."""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    intersection = (right - left) * (bottom - top)
+    area = lambda box: (box[1] - box[3]) * (box[2] - box[0])
+    return intersection / (area(a) + area(b) - intersection)
+
+
+def validate_polygons(polygons):
+    if not isinstance(polygons, list):
+        raise ValueError("ROI polygons must be a list of polygons.")
+    for polygon in polygons:
+        if not isinstance(polygon, list) or len(polygon) < 3:
+            raise ValueError("Each ROI polygon needs at least three [x, y] points.")
+        for point in polygon:
+            if (not isinstance(point, (list, tuple)) or len(point) != 2
+                    or not all(isinstance(value, (int, float)) for value in point)):
+                raise ValueError(f"Invalid ROI point: {point!r}")
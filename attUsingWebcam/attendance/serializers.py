@@ -1,14 +1,33 @@
 # attendance/serializers.py
 from rest_framework import serializers
-from .models import Student, Attendance
+from .models import Student, Attendance, FaceEncoding
 
 class StudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Student
-        fields = ['id', 'name', 'student_id', 'phone', 'email', 'profile_image']
+        fields = ['id', 'name', 'student_id', 'phone', 'email', 'profile_image', 'thumbnail']
+        read_only_fields = ['thumbnail']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        # Optional subset of Meta.fields, e.g. StudentSerializer(qs, many=True, fields=['id', 'name'])
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 class AttendanceSerializer(serializers.ModelSerializer):
     student = StudentSerializer(read_only=True)
     class Meta:
         model = Attendance
         fields = ['id', 'student', 'date', 'timestamp']
+
+class FaceEncodingSerializer(serializers.ModelSerializer):
+    has_face = serializers.SerializerMethodField()
+
+    class Meta:
+        model = FaceEncoding
+        fields = ['id', 'student', 'image', 'created_at', 'has_face']
+        read_only_fields = ['student']
+
+    def get_has_face(self, obj):
+        return bool(obj.encoding)
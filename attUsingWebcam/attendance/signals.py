@@ -0,0 +1,31 @@
+# attendance/signals.py
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .models import FaceEncoding, Section, Student, delete_unreferenced_derived
+from .versions import bump_version
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=FaceEncoding)
+@receiver(post_delete, sender=FaceEncoding)
+def student_changed(sender, **kwargs):
+    bump_version('students')
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    delete_unreferenced_derived([instance.normalized_image.name, instance.thumbnail.name])
+
+
+@receiver(m2m_changed, sender=Section.students.through)
+def roster_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version('rosters')
+
+
+# Sub-galleries are cached per section, so saving or deleting a ClassSession
+# changes no roster; only a deleted section's gallery goes stale.
+@receiver(post_delete, sender=Section)
+def section_deleted(sender, **kwargs):
+    bump_version('rosters')
@@ -1,3 +1,855 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from types import SimpleNamespace
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .budget import FrameBudget
+from .completion import (
+    CompletionPolicy,
+    END_OF_VIDEO,
+    HEADCOUNT_REACHED,
+    NO_NEW_FACES,
+    ROSTER_COMPLETE,
+)
+from .encoding import ENROLLMENT_DIMENSION, encode_face, encode_task, load_rgb
+from .face_models import face_encodings, face_locations
+from .gallery import ENCODING_SIZE, MAX_MEDOIDS, Gallery, compact_encodings, get_galleries, global_gallery
+from .management.commands.replay_recognition import Corpus
+from .models import (
+    Attendance,
+    ClassSession,
+    Course,
+    FaceEncoding,
+    RecognitionLog,
+    Section,
+    Student,
+    delete_unreferenced_derived,
+    store_derived,
+)
+from .recognition import (
+    create_attendance_records,
+    match_faces,
+    recognition_log,
+    save_recognition_log,
+    scan_video,
+)
+from .roi import CameraLayout, validate_polygons
+from .video_decoders import DECODERS, av, choose_decoder, get_decoder
+from .write_queue import AttendanceWriteQueue
 
-# Create your tests here.
+
+TOLERANCE = 0.6
+PHOTO = os.path.join(settings.MEDIA_ROOT, 'profile_images', 'Elon_Musk_Royal_Society_crop.jpg')
+
+
+def student(pk):
+    # Unsaved model instance: hashable by pk, like the gallery's real students
+    return Student(id=pk, name=f"Student {pk}")
+
+
+def create_students(count, encodings=None):
+    """Students with stored encodings; bulk_create skips Student.save(), which would try to read the photos."""
+    return Student.objects.bulk_create(
+        Student(name=f"Student {n}", student_id=f"S{n}", phone="0", email=f"s{n}@example.com",
+                profile_image=f"profile_images/s{n}.jpg",
+                face_encoding=json.dumps(encodings[n].tolist()) if encodings is not None else None)
+        for n in range(count)
+    )
+
+
+def write_video(path, frame_count=30, fps=10):
+    """1280x720 clip where every frame is filled with its own index * 8, so sampling can be checked."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (1280, 720))
+    for index in range(frame_count):
+        writer.write(np.full((720, 1280, 3), index * 8, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+class FakeClock:
+    """Stands in for time.perf_counter; tests advance it by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class VideoDecoderTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        cls.video_path = write_video(os.path.join(directory.name, 'clip.mp4'))
+
+    def test_choose_decoder(self):
+        self.assertEqual(choose_decoder(), 'opencv')
+        self.assertEqual(choose_decoder('opencv-hw'), 'opencv-hw')
+        with self.assertRaises(ValueError):
+            choose_decoder('vlc')
+
+    @unittest.skipIf(av is None, "PyAV is not installed")
+    def test_fast_mode_needs_a_keyframe_decoder(self):
+        self.assertEqual(choose_decoder(fast=True), 'pyav')
+        self.assertEqual(choose_decoder('pyav', fast=True), 'pyav')
+        # An explicitly requested decoder is never swapped behind the client's back
+        with self.assertRaises(ValueError):
+            choose_decoder('opencv', fast=True)
+
+    def test_frame_skip_sampling(self):
+        for name in ('opencv', 'pyav') if av is not None else ('opencv',):
+            with self.subTest(decoder=name), get_decoder(name, self.video_path, frame_skip=5) as video:
+                frames = list(video.frames())
+                self.assertAlmostEqual(video.duration, 3.0, places=1)
+
+            self.assertEqual([index for index, _, _ in frames], [4, 9, 14, 19, 24, 29])
+            self.assertEqual(frames[0][2].shape, (360, 640, 3))
+            # The frame yielded is the frame sampled, not one before or after it
+            self.assertAlmostEqual(float(frames[1][2].mean()), 9 * 8, delta=4)
+
+    def test_gray_frames(self):
+        with get_decoder('opencv', self.video_path, frame_skip=10, pixel_format='gray') as video:
+            frames = list(video.frames())
+
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(frames[0][2].shape, (360, 640))
+
+    def test_only_pyav_skips_non_keyframes(self):
+        self.assertEqual([name for name, decoder in DECODERS.items() if decoder.keyframes], ['pyav'])
+
+
+class FaceModelTests(TestCase):
+    def test_threads_get_the_same_encodings(self):
+        rgb_image = load_rgb(PHOTO, 400)
+        locations = face_locations(rgb_image)
+        self.assertEqual(len(locations), 1)
+        expected = face_encodings(rgb_image, locations)[0]
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda _: encode_face(rgb_image), range(8)))
+        for encoding in results:
+            np.testing.assert_allclose(encoding, expected, atol=1e-6)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AsyncUploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # A small copy keeps HOG detection in the views fast
+        rgb_image = load_rgb(PHOTO, 400)
+        self.enrolled, = create_students(1, encode_face(rgb_image)[None, :])
+        self.photo = cv2.imencode('.jpg', cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR))[1].tobytes()
+
+    def upload(self):
+        return SimpleUploadedFile('photo.jpg', self.photo, content_type='image/jpeg')
+
+    async def test_image_upload_marks_attendance(self):
+        response = await self.async_client.post('/api/attendance/image-upload/async/', {'image': self.upload()})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["students"], [self.enrolled.name])
+        self.assertEqual(response.json()["faces"][0]["student"], self.enrolled.name)
+        self.assertTrue(await Attendance.objects.filter(student=self.enrolled).aexists())
+
+    async def test_concurrent_uploads_mark_attendance_once(self):
+        responses = await asyncio.gather(*(
+            self.async_client.post('/api/attendance/image-upload/async/', {'image': self.upload()})
+            for _ in range(3)
+        ))
+
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        self.assertEqual(await Attendance.objects.filter(student=self.enrolled).acount(), 1)
+
+    async def test_invalid_requests(self):
+        cases = [
+            ('/api/attendance/image-upload/async/', {}),
+            ('/api/attendance/image-upload/async/', {'image': self.upload(), 'session': '999'}),
+            ('/api/attendance/image-upload/async/', {'image': self.upload(), 'camera': '999'}),
+            ('/api/attendance/upload/async/', {}),
+        ]
+        for url, data in cases:
+            with self.subTest(url=url, fields=sorted(data)):
+                response = await self.async_client.post(url, data)
+                self.assertEqual(response.status_code, 400)
+
+
+class CameraLayoutTests(TestCase):
+    def detector(self, *boxes):
+        """Fake detector returning fixed tile-relative boxes and recording its calls."""
+        self.calls = []
+
+        def detect(image, upsample):
+            self.calls.append((image.shape[:2], upsample))
+            return list(boxes)
+        return detect
+
+    def test_full_frame_is_detected_at_old_resolution(self):
+        image = np.zeros((720, 1280, 3), dtype=np.uint8)
+        locations = CameraLayout().face_locations(image, self.detector((50, 150, 150, 50)), 640)
+
+        self.assertEqual(self.calls, [((360, 640), 1)])
+        self.assertEqual(locations, [(100, 300, 300, 100)])
+
+    def test_roi_boxes_map_back_to_frame_coordinates(self):
+        # Native 2560x1440 camera decoded at 1280x720
+        layout = CameraLayout(
+            polygons=[[[1000, 400], [1800, 400], [1800, 1000], [1000, 1000]]],
+            frame_size=(2560, 1440),
+            min_face_size=160,
+            max_face_size=200,
+        )
+        (x0, y0, x1, y1, polygon, scale), = layout.tiles((1280, 720))
+        self.assertEqual((x0, y0, x1, y1, scale), (450, 150, 951, 551, 1.0))
+
+        image = np.zeros((720, 1280, 3), dtype=np.uint8)
+        inside, outside, too_small = (60, 150, 150, 60), (0, 90, 90, 0), (100, 140, 140, 100)
+        locations = layout.face_locations(image, self.detector(inside, outside, too_small))
+
+        self.assertEqual(self.calls, [((401, 501), 0)])
+        self.assertEqual(locations, [(210, 600, 300, 510)])
+
+    def test_overlapping_tiles_report_a_face_once(self):
+        layout = CameraLayout(polygons=[
+            [[0, 0], [400, 0], [400, 400], [0, 400]],
+            [[0, 0], [400, 0], [400, 400], [0, 400]],
+        ])
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+
+        self.assertEqual(len(layout.face_locations(image, self.detector((10, 110, 110, 10)))), 1)
+
+    def test_validate_polygons(self):
+        validate_polygons([[[0, 0], [10, 0], [10, 10]]])
+        for polygons in ({}, [[[0, 0], [10, 0]]], [[[0, 0], [10, 0], ['a', 10]]]):
+            with self.subTest(polygons=polygons), self.assertRaises(ValueError):
+                validate_polygons(polygons)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SessionGalleryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rng = np.random.default_rng(0)
+        # Random 128-d points lie ~1.6 apart, far beyond the tolerance
+        self.bases = self.rng.normal(0.0, 0.1, (3, ENCODING_SIZE))
+        self.students = create_students(3, self.bases)
+        self.section = Section.objects.create(course=Course.objects.create(code="CS1", name="Intro"), name="A")
+        self.section.students.add(*self.students[:2])
+
+    def session(self):
+        return ClassSession.objects.create(section=self.section, starts_at=timezone.now())
+
+    def test_session_gallery_holds_the_roster(self):
+        gallery, fallback = get_galleries(self.session().pk)
+
+        self.assertEqual([s.pk for s in gallery.students], [s.pk for s in self.students[:2]])
+        self.assertEqual(len(fallback), 3)
+        self.assertEqual(get_galleries(None)[1], None)
+
+    def test_sessions_of_a_section_share_one_gallery(self):
+        first, _ = get_galleries(self.session().pk)
+        second, _ = get_galleries(self.session().pk)
+        self.assertIs(first, second)
+
+        self.section.students.add(self.students[2])
+        rebuilt, _ = get_galleries(self.session().pk)
+        self.assertIsNot(rebuilt, first)
+        self.assertEqual(len(rebuilt), 3)
+
+    def test_unknown_session(self):
+        with self.assertRaises(ClassSession.DoesNotExist):
+            get_galleries(12345)
+
+    def test_replace_takes_rows_from_fallback(self):
+        gallery = Gallery([student(pk) for pk in (1, 2, 3)], [base[None, :] for base in self.bases])
+        roster = gallery.subset([1])
+        faces = self.bases[[0, 2]] + self.rng.normal(0.0, 0.01, (2, ENCODING_SIZE))
+        result = roster.match(faces, TOLERANCE)
+        self.assertEqual(list(result.unmatched), [1])
+
+        result.replace(result.unmatched, gallery.match(faces[result.unmatched], TOLERANCE))
+        self.assertEqual({s.pk for s in result.students}, {1, 3})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MultipleEncodingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rng = np.random.default_rng(0)
+        self.base = self.rng.normal(0.0, 0.1, ENCODING_SIZE)
+
+    def test_compact_encodings_uses_centroid_for_few_encodings(self):
+        few = self.rng.normal(0.0, 0.1, (MAX_MEDOIDS + 1, ENCODING_SIZE))
+        many = self.rng.normal(0.0, 0.1, (MAX_MEDOIDS + 3, ENCODING_SIZE))
+
+        np.testing.assert_allclose(compact_encodings(few), few.mean(axis=0)[None, :])
+        self.assertEqual(len(compact_encodings(many)), MAX_MEDOIDS + 1)
+
+    def test_face_near_outlier_encoding_is_reranked(self):
+        # Six enrollment images far apart: neither the centroid nor the medoids
+        # are within tolerance of all of them.
+        offsets = np.zeros((6, ENCODING_SIZE))
+        offsets[np.arange(6), np.arange(6)] = 0.5
+        encodings = self.base + offsets
+        gallery = Gallery([student(1)], [encodings])
+        tolerance = 0.3
+
+        compact = gallery.distances(encodings)[:, 0]
+        outlier = int(compact.argmax())
+        self.assertGreater(compact[outlier], tolerance)
+
+        result = gallery.match(encodings[outlier] + self.rng.normal(0.0, 0.001, ENCODING_SIZE), tolerance)
+        self.assertTrue(result.accepted[0])
+        self.assertLess(result.distances[0, 0], 0.05)
+
+    def test_global_gallery_includes_extra_encodings(self):
+        enrolled, extra_only, without = create_students(3, self.rng.normal(0.0, 0.1, (3, ENCODING_SIZE)))
+        Student.objects.filter(pk__in=[extra_only.pk, without.pk]).update(face_encoding=None)
+        FaceEncoding.objects.bulk_create(
+            FaceEncoding(student=owner, image='enrollment_images/x.jpg', encoding=json.dumps(self.base.tolist()))
+            for owner in (enrolled, extra_only, extra_only)
+        )
+
+        gallery = global_gallery()
+        self.assertEqual([s.pk for s in gallery.students], [enrolled.pk, extra_only.pk])
+        self.assertEqual([len(e) for e in gallery.encoding_sets], [2, 2])
+
+    def test_extra_image_is_encoded_like_reencode_faces(self):
+        owner, = create_students(1)
+        with open(PHOTO, 'rb') as photo, tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                extra = FaceEncoding.objects.create(
+                    student=owner, image=SimpleUploadedFile('extra.jpg', photo.read())
+                )
+
+        expected = encode_face(load_rgb(PHOTO, ENROLLMENT_DIMENSION))
+        np.testing.assert_allclose(json.loads(extra.encoding), expected)
+
+    def test_extra_image_size_limit(self):
+        owner, = create_students(1)
+        too_large = SimpleUploadedFile('extra.jpg', b'0' * (10 * 1024 * 1024 + 1), content_type='image/jpeg')
+        response = self.client.post(reverse('student-face-encodings', args=[owner.pk]), {'image': too_large})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(FaceEncoding.objects.exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReencodeFacesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_root = directory.name
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.checkpoint = os.path.join(media_root, 'checkpoint.json')
+
+        os.makedirs(os.path.join(media_root, 'profile_images'))
+        shutil.copy(PHOTO, os.path.join(media_root, 'profile_images', 's0.jpg'))
+        cv2.imwrite(os.path.join(media_root, 'profile_images', 's1.jpg'), np.zeros((200, 200, 3), np.uint8))
+        # s2.jpg is missing, as on a host without the media volume
+        self.old = np.zeros(ENCODING_SIZE)
+        self.face, self.blank, self.missing = create_students(3, np.tile(self.old, (3, 1)))
+
+    def reencode(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('reencode_faces', '--target', 'students', '--workers', '1', '--batch-size', '1',
+                     '--checkpoint', self.checkpoint, *args, stdout=out, stderr=err)
+        return out.getvalue()
+
+    def encoding(self, student):
+        value = Student.objects.get(pk=student.pk).face_encoding
+        return None if value is None else np.array(json.loads(value))
+
+    def test_reencode(self):
+        output = self.reencode()
+
+        self.assertGreater(np.abs(self.encoding(self.face) - self.old).max(), 0.01)
+        self.assertIsNone(self.encoding(self.blank))
+        # An unreadable image keeps its working encoding
+        np.testing.assert_array_equal(self.encoding(self.missing), self.old)
+        self.assertIn("re-encoded 1 of 3 images", output)
+        self.assertIn(f"encodings cleared for pks {self.blank.pk};", output)
+        self.assertIn(f"could not read the images of pks {self.missing.pk};", output)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resume_after_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'students': self.face.pk, 'max_dimension': ENROLLMENT_DIMENSION}, f)
+        output = self.reencode('--resume')
+
+        self.assertIn(f"resuming after pk {self.face.pk}", output)
+        np.testing.assert_array_equal(self.encoding(self.face), self.old)
+        self.assertIsNone(self.encoding(self.blank))
+
+    def test_resume_rejects_other_max_dimension(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'students': self.face.pk, 'max_dimension': 500}, f)
+        with self.assertRaises(CommandError):
+            self.reencode('--resume')
+
+    def test_worker_runs_without_django_setup(self):
+        # "spawn" is the only start method on Windows and the default on macOS
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            pk, encoding, error = pool.submit(encode_task, (7, PHOTO, 400)).result()
+
+        self.assertEqual((pk, error), (7, None))
+        self.assertEqual(len(json.loads(encoding)), ENCODING_SIZE)
+
+
+class AttendanceWriteTests(TestCase):
+    def setUp(self):
+        self.students = create_students(3)
+
+    def test_one_row_per_student_and_day(self):
+        create_attendance_records(self.students[:2], queued=False)
+        create_attendance_records(self.students, queued=False)
+
+        self.assertEqual(Attendance.objects.count(), 3)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Attendance.objects.create(student=self.students[0])
+
+    def test_queue_write_skips_existing_rows(self):
+        ids = {student.id for student in self.students}
+        self.assertEqual(AttendanceWriteQueue.write(ids), ids)
+        self.assertEqual(AttendanceWriteQueue.write(ids), set())
+        self.assertEqual(Attendance.objects.count(), 3)
+
+    def test_queue_coalesces_requests(self):
+        writes = []
+        write_queue = AttendanceWriteQueue(max_wait=0.5)
+        write_queue.write = lambda student_ids: writes.append(student_ids) or student_ids
+
+        futures = [write_queue.submit(students) for students in ([student(1), student(2)], [student(2), student(3)])]
+
+        self.assertEqual([future.result(timeout=5) for future in futures], [2, 2])
+        self.assertEqual(writes, [{1, 2, 3}])
+
+    def test_queue_failure_reaches_every_request(self):
+        def write(student_ids):
+            if 13 in student_ids:
+                raise OperationalError("disk I/O error")
+            return student_ids
+
+        write_queue = AttendanceWriteQueue(max_wait=0.5)
+        write_queue.write = write
+        futures = [write_queue.submit([student(13)]), write_queue.submit([student(1)])]
+        for future in futures:
+            with self.assertRaises(OperationalError):
+                future.result(timeout=5)
+
+        # The writer thread survives a failed batch
+        self.assertEqual(write_queue.submit([student(1)]).result(timeout=5), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StudentListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        create_students(3)
+        self.url = reverse('student-list')
+
+    def test_unchanged_roster_is_not_modified(self):
+        response = self.client.get(self.url, {'fields': 'id,name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, {'fields': 'id,name'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_differs_per_variant(self):
+        full = self.client.get(self.url)['ETag']
+        compact = self.client.get(self.url, {'compact': '1'})['ETag']
+
+        self.assertNotEqual(full, compact)
+
+    def test_student_change_invalidates_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Student.objects.first().delete()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_compact_and_paginated_payloads(self):
+        response = self.client.get(self.url, {'fields': 'id,name', 'compact': '1', 'page': '2', 'page_size': '2'})
+        data = response.json()
+
+        self.assertEqual((data['count'], data['page'], data['page_size']), (3, 2, 2))
+        self.assertEqual(data['results']['fields'], ['id', 'name'])
+        self.assertEqual(data['results']['rows'], [[Student.objects.last().pk, "Student 2"]])
+
+    def test_invalid_parameters(self):
+        for params in ({'fields': 'id,face_encoding'}, {'page': 'x'}, {'page': '0'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DerivedImageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        with open(PHOTO, 'rb') as photo:
+            self.photo = photo.read()
+        self.storage = Student._meta.get_field('thumbnail').storage
+
+    def enroll(self, n, data=None):
+        return Student.objects.create(
+            name=f"Student {n}", student_id=f"S{n}", phone="0", email=f"s{n}@example.com",
+            profile_image=SimpleUploadedFile(f"s{n}.jpg", data or self.photo),
+        )
+
+    def test_enrollment_derives_images_and_encoding(self):
+        enrolled = self.enroll(0)
+
+        self.assertTrue(enrolled.normalized_image.name.startswith('derived/normalized/'))
+        self.assertTrue(self.storage.exists(enrolled.thumbnail.name))
+        self.assertEqual(len(json.loads(enrolled.face_encoding)), ENCODING_SIZE)
+
+    def test_photo_without_face_is_not_encoded(self):
+        blank = cv2.imencode('.jpg', np.full((300, 300, 3), 128, np.uint8))[1].tobytes()
+        with self.assertLogs('attendance.models', 'WARNING') as logs:
+            enrolled = self.enroll(0, blank)
+
+        self.assertTrue(enrolled.thumbnail)
+        self.assertIsNone(enrolled.face_encoding)
+        self.assertIn("No face found", logs.output[0])
+
+    def test_store_derived_reuses_identical_files(self):
+        first, second = create_students(2)
+        store_derived(first.thumbnail, b'thumbnail bytes')
+        store_derived(second.thumbnail, b'thumbnail bytes')
+
+        self.assertEqual(first.thumbnail.name, second.thumbnail.name)
+        self.assertEqual(os.listdir(os.path.dirname(self.storage.path(first.thumbnail.name))), [
+            os.path.basename(first.thumbnail.name)
+        ])
+
+    def test_shared_files_are_deleted_with_their_last_student(self):
+        first, second = self.enroll(0), self.enroll(1)
+        names = [first.normalized_image.name, first.thumbnail.name]
+        self.assertEqual(names, [second.normalized_image.name, second.thumbnail.name])
+
+        first.delete()
+        self.assertTrue(all(self.storage.exists(name) for name in names))
+        second.delete()
+        self.assertFalse(any(self.storage.exists(name) for name in names))
+
+    def test_replaced_photo_removes_old_derived_files(self):
+        enrolled = self.enroll(0)
+        old = enrolled.thumbnail.name
+        enrolled.profile_image = SimpleUploadedFile("new.jpg", cv2.imencode('.jpg', load_rgb(PHOTO, 300))[1].tobytes())
+        enrolled.save()
+
+        self.assertNotEqual(enrolled.thumbnail.name, old)
+        self.assertFalse(self.storage.exists(old))
+
+    def test_delete_unreferenced_derived_ignores_empty_names(self):
+        delete_unreferenced_derived([None, ''])
+
+
+class CompletionPolicyTests(TestCase):
+    def test_roster_complete_after_min_votes(self):
+        policy = CompletionPolicy(expected_ids=[1, 2], min_votes=2)
+
+        self.assertIsNone(policy.update([student(1), student(2)]))
+        self.assertEqual(policy.update([student(1), student(2)]), ROSTER_COMPLETE)
+
+    def test_headcount_reached(self):
+        policy = CompletionPolicy(expected_count=2, min_votes=1)
+
+        self.assertIsNone(policy.update([student(1)]))
+        self.assertEqual(policy.update([student(3)]), HEADCOUNT_REACHED)
+
+    def test_patience_counts_frames_without_new_faces(self):
+        policy = CompletionPolicy(patience=2)
+
+        self.assertIsNone(policy.update([student(1)]))
+        self.assertIsNone(policy.update([student(1)]))
+        self.assertEqual(policy.update([]), NO_NEW_FACES)
+
+    def test_patience_waits_for_the_first_face(self):
+        policy = CompletionPolicy(patience=3)
+
+        for _ in range(5):
+            self.assertIsNone(policy.update([]))
+        self.assertIsNone(policy.update([student(1)]))
+        self.assertIsNone(policy.update([]))
+        self.assertIsNone(policy.update([]))
+        self.assertEqual(policy.update([]), NO_NEW_FACES)
+
+    def test_inactive_without_criteria(self):
+        policy = CompletionPolicy()
+
+        self.assertFalse(policy.active)
+        self.assertIsNone(policy.update([student(1)]))
+
+    def test_from_request(self):
+        gallery = SimpleNamespace(index={4: 0, 7: 1})
+        policy = CompletionPolicy.from_request({'expected': 'roster', 'min_votes': '3'}, gallery, session=True)
+        self.assertEqual(policy.expected_ids, {4, 7})
+        self.assertEqual(policy.min_votes, 3)
+
+        policy = CompletionPolicy.from_request({'expected': '1, 2', 'patience': ''})
+        self.assertEqual(policy.expected_ids, {1, 2})
+        self.assertIsNone(policy.patience)
+
+    def test_from_request_rejects_invalid_fields(self):
+        for data in ({'expected': 'roster'}, {'expected': 'a,b'}, {'min_votes': 'x'}, {'patience': '0'}):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                CompletionPolicy.from_request(data)
+
+
+class FrameBudgetTests(TestCase):
+    interval = 5 / 30  # every fifth frame of a 30 fps video
+
+    def scan(self, duration, budget_seconds, decode_cost, analysis_cost):
+        """Replay scan_video's loop against a fake clock; returns (budget, stopped_early)."""
+        clock = FakeClock()
+        budget = FrameBudget(budget_seconds, duration, clock=clock)
+        for frame in range(1, int(duration / self.interval) + 1):
+            seconds = frame * self.interval
+            clock.now += decode_cost
+            analyse = budget.frame_decoded(seconds)
+            if budget.exhausted():
+                return budget, not budget.reached_end()
+            if analyse:
+                clock.now += analysis_cost
+                budget.frame_analysed(seconds)
+        return budget, False
+
+    def test_generous_budget_analyses_every_frame(self):
+        budget, stopped_early = self.scan(10, 60, 0.001, 0.01)
+
+        self.assertFalse(stopped_early)
+        self.assertEqual(budget.coverage()["frames_analysed"], 60)
+
+    def test_analysis_is_spread_over_the_whole_clip(self):
+        budget, stopped_early = self.scan(60, 2, 0.001, 0.1)
+        coverage = budget.coverage()
+
+        self.assertFalse(stopped_early)
+        self.assertAlmostEqual(coverage["seconds_decoded"], 60, delta=self.interval)
+        self.assertGreater(coverage["frames_analysed"], 5)
+        self.assertLessEqual(coverage["processing_seconds"], 2)
+        # Far from the 60 s gap of analysing only the first frames
+        self.assertLess(coverage["largest_gap_seconds"], 15)
+
+    def test_long_video_still_analyses_frames(self):
+        # Decoding all 600 s alone would take 72 s of a 30 s budget
+        budget, stopped_early = self.scan(600, 30, 0.02, 0.2)
+        coverage = budget.coverage()
+
+        self.assertTrue(stopped_early)
+        self.assertGreater(coverage["frames_analysed"], 20)
+        self.assertLessEqual(coverage["processing_seconds"], 30)
+
+    def test_budget_running_out_on_last_frame_reaches_end(self):
+        clock = FakeClock()
+        budget = FrameBudget(1, 1.0, clock=clock)
+        for frame in range(1, 7):
+            clock.now += 0.1
+            budget.frame_decoded(frame * self.interval)
+        clock.now = 0.99
+
+        self.assertTrue(budget.exhausted())
+        self.assertTrue(budget.reached_end())
+
+    def test_scan_reports_coverage(self):
+        with tempfile.TemporaryDirectory() as directory:
+            scan = scan_video(write_video(os.path.join(directory, 'clip.mp4')), Gallery([], []), budget_seconds=30)
+
+        self.assertEqual(scan.stop_reason, END_OF_VIDEO)
+        self.assertFalse(scan.partial)
+        self.assertEqual(scan.coverage["video_seconds"], 3.0)
+        self.assertEqual(scan.coverage["frames_analysed"], 6)
+        self.assertEqual(scan.students, set())
+
+
+class MatchResultTests(TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        # Random 128-d points lie ~1.6 apart, far beyond the tolerance
+        self.bases = self.rng.normal(0.0, 0.1, (3, ENCODING_SIZE))
+        self.students = [student(pk) for pk in (1, 2, 3)]
+        self.gallery = Gallery(self.students, [base[None, :] for base in self.bases])
+
+    def near(self, encoding, spread=0.01):
+        return encoding + self.rng.normal(0.0, spread, ENCODING_SIZE)
+
+    def test_match_ranks_nearest_students(self):
+        faces = np.vstack([self.near(self.bases[1]), self.near(self.bases[2])])
+        result = self.gallery.match(faces, TOLERANCE)
+
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result.candidates[0, 0], self.students[1])
+        self.assertEqual(result.candidates[1, 0], self.students[2])
+        self.assertTrue(np.all(np.diff(result.distances, axis=1) >= 0))
+        self.assertTrue(result.accepted.all())
+        self.assertEqual(result.students, {self.students[1], self.students[2]})
+
+    def test_unknown_face_is_unmatched(self):
+        result = self.gallery.match(self.rng.normal(0.0, 0.1, ENCODING_SIZE), TOLERANCE)
+
+        self.assertEqual(list(result.unmatched), [0])
+        self.assertEqual(result.students, set())
+        self.assertIsNone(result.faces()[0]["student"])
+
+    def test_min_margin_rejects_ambiguous_face(self):
+        twins = Gallery(
+            [student(1), student(2)],
+            [self.bases[0][None, :], self.near(self.bases[0], 0.005)[None, :]],
+        )
+        face = self.near(self.bases[0])
+
+        self.assertTrue(twins.match(face, TOLERANCE).accepted[0])
+        self.assertFalse(twins.match(face, TOLERANCE, min_margin=0.1).accepted[0])
+
+    def test_small_gallery_pads_candidates(self):
+        gallery = Gallery([self.students[0]], [self.bases[0][None, :]])
+        result = gallery.match(self.near(self.bases[0]), TOLERANCE, top_k=3)
+
+        self.assertEqual(list(result.candidates[0, 1:]), [None, None])
+        self.assertTrue(np.isinf(result.distances[0, 1:]).all())
+        self.assertTrue(result.accepted[0])
+        self.assertIsNone(result.faces()[0]["margin"])
+
+    def test_faces_only_names_accepted_students(self):
+        faces = np.vstack([self.near(self.bases[0]), self.rng.normal(0.0, 0.1, ENCODING_SIZE)])
+        summary = self.gallery.match(faces, TOLERANCE).faces()
+
+        self.assertEqual(summary[0]["student"], "Student 1")
+        self.assertIsNone(summary[1]["student"])
+        self.assertEqual(set(summary[0]), {"student", "distance", "margin"})
+
+    def test_match_faces_reads_the_tolerance_setting(self):
+        face = self.near(self.bases[0], 0.02)  # about 0.23 from student 1
+
+        self.assertEqual(match_faces(face, self.gallery).students, {self.students[0]})
+        with override_settings(RECOGNITION_TOLERANCE=0.1):
+            result = match_faces(face, self.gallery)
+        self.assertEqual(result.students, set())
+        self.assertEqual(result.tolerance, 0.1)
+
+    def test_recognition_log(self):
+        faces = np.vstack([self.near(self.bases[0]), self.rng.normal(0.0, 0.1, ENCODING_SIZE)])
+        students = create_students(3, self.bases)
+        gallery = Gallery(students, [base[None, :] for base in self.bases])
+        save_recognition_log(recognition_log([(4, 0.4, gallery.match(faces, TOLERANCE))], 'video'))
+
+        accepted, rejected = RecognitionLog.objects.order_by('pk')
+        self.assertEqual(accepted.batch, rejected.batch)
+        self.assertEqual((accepted.frame_index, accepted.seconds, accepted.accepted), (4, 0.4, True))
+        self.assertEqual(accepted.candidate_ids[0], students[0].pk)
+        self.assertEqual(len(accepted.distances), 3)
+        self.assertFalse(rejected.accepted)
+        np.testing.assert_allclose(np.frombuffer(accepted.encoding, np.float32), faces[0], atol=1e-6)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReplayRecognitionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.rng = np.random.default_rng(0)
+        self.bases = self.rng.normal(0.0, 0.1, (3, ENCODING_SIZE))
+        create_students(3, self.bases)
+
+    def near(self, n):
+        return (self.bases[n] + self.rng.normal(0.0, 0.01, ENCODING_SIZE)).astype(np.float32)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def corpus(self, base_skip=1):
+        # Video: student 0 in all ten frames, student 1 in frame 3 and student 2,
+        # who is not labelled present, in frame 9. Image: student 0.
+        corpus = Corpus()
+        corpus.files, corpus.kinds = ['class.mp4', 'photo.jpg'], ['video', 'image']
+        for index in range(10):
+            faces = [self.near(0)] + [self.near(n) for n, frame in ((1, 3), (2, 9)) if index == frame]
+            corpus.add_frame(0, index, index / 10, 0.1, faces)
+        corpus.add_frame(1, 0, 0.0, 0.2, [self.near(0)])
+        path = os.path.join(self.directory, 'corpus.npz')
+        corpus.save(path, {'source': 'files', 'base_skip': base_skip})
+        return path
+
+    def replay(self, corpus, *args):
+        labels = self.write('labels.json', json.dumps({'class.mp4': ['S0', 'S1'], 'photo.jpg': ['S0']}))
+        table = os.path.join(self.directory, 'replay.csv')
+        call_command('replay_recognition', 'replay', corpus, '--labels', labels, '--csv', table, *args,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        with open(table) as f:
+            return list(csv.DictReader(f))
+
+    def row(self, rows, **params):
+        row, = [row for row in rows if all(row[key] == str(value) for key, value in params.items())]
+        return row
+
+    def test_scores(self):
+        rows = self.replay(self.corpus(), '--thresholds', '0.5', '0.01', '--frame-skips', '1', '5')
+        counts = lambda row: (row['true_positives'], row['false_positives'], row['false_negatives'])
+
+        every = self.row(rows, threshold=0.5, frame_skip=1)
+        self.assertEqual(counts(every), ('3', '1', '0'))
+        self.assertEqual(every['frames'], '11')
+        self.assertAlmostEqual(float(every['cost_seconds']), 1.2, places=5)
+        # Every fifth frame is 4 and 9: student 1 is missed, student 2 still seen
+        self.assertEqual(counts(self.row(rows, threshold=0.5, frame_skip=5)), ('2', '1', '1'))
+        self.assertEqual(counts(self.row(rows, threshold=0.01, frame_skip=1)), ('0', '0', '3'))
+
+    def test_min_votes_only_applies_to_videos(self):
+        rows = self.replay(self.corpus(), '--thresholds', '0.5', '--frame-skips', '1', '--min-votes', '3')
+        row = self.row(rows, min_votes=3)
+
+        # Students 1 and 2 are seen in one video frame each; the image still
+        # counts with its single match.
+        self.assertEqual((row['true_positives'], row['false_positives'], row['false_negatives']), ('2', '0', '1'))
+
+    def test_frame_skips_must_be_multiples_of_the_base_skip(self):
+        corpus = self.corpus(base_skip=5)
+        self.assertEqual({row['frame_skip'] for row in self.replay(corpus)}, {'5', '10', '15', '30'})
+        with self.assertRaises(CommandError):
+            self.replay(corpus, '--frame-skips', '3')
+
+    def test_extract_log(self):
+        students = list(Student.objects.order_by('pk'))
+        gallery = Gallery(students, [base[None, :] for base in self.bases])
+        save_recognition_log(recognition_log([(4, 0.4, gallery.match(self.near(0), TOLERANCE))], 'video'))
+        corpus = os.path.join(self.directory, 'log.npz')
+        call_command('replay_recognition', 'extract-log', '--output', corpus, stdout=io.StringIO())
+
+        data = np.load(corpus)
+        self.assertEqual(json.loads(str(data['metadata']))['base_skip'], 5)
+        self.assertEqual(len(data['encodings']), 1)
@@ -8,14 +8,20 @@ from .views import (
     AttendancePDFExportAPIView,
     AttendanceImageUploadAPIView,
     StudentListAPIView,
+    StudentFaceEncodingCreateAPIView,
 )
+from .async_views import AsyncAttendanceImageUploadView, AsyncAttendanceUploadView
 
 urlpatterns = [
     path('students/', StudentCreateAPIView.as_view(), name='student-create'),
     path('studentslist/', StudentListAPIView.as_view(), name='student-list'),
+    path('students/<int:pk>/face-encodings/', StudentFaceEncodingCreateAPIView.as_view(), name='student-face-encodings'),
     path('attendance/upload/', AttendanceUploadAPIView.as_view(), name='attendance-upload'),
     path('attendance/report/', AttendanceReportAPIView.as_view(), name='attendance-report'),
     path('attendance/export/excel/', AttendanceExcelExportAPIView.as_view(), name='attendance-export-excel'),
     path('attendance/export/pdf/', AttendancePDFExportAPIView.as_view(), name='attendance-export-pdf'),
     path('attendance/image-upload/', AttendanceImageUploadAPIView.as_view(), name='attendance-export-pdf'),
+    # Async variants for ASGI deployments
+    path('attendance/upload/async/', AsyncAttendanceUploadView.as_view(), name='attendance-upload-async'),
+    path('attendance/image-upload/async/', AsyncAttendanceImageUploadView.as_view(), name='attendance-image-upload-async'),
 ]
@@ -0,0 +1,25 @@
+# attendance/versions.py
+#
+# Opaque version tokens kept in Django's cache. Anything derived from a table
+# (galleries, serialized payloads) remembers the token it was built from and
+# is rebuilt once the token changes, in every process sharing the cache
+# (see CACHES in settings; a per-process cache would keep other workers stale).
+import uuid
+from django.core.cache import cache
+
+
+def _key(name):
+    return f'attendance:version:{name}'
+
+
+def get_version(name):
+    version = cache.get(_key(name))
+    if version is None:
+        # Never set or evicted: start a fresh token so nothing stale matches it
+        cache.add(_key(name), uuid.uuid4().hex, None)
+        version = cache.get(_key(name))
+    return version
+
+
+def bump_version(name):
+    cache.set(_key(name), uuid.uuid4().hex, None)
@@ -0,0 +1,224 @@
+# attendance/video_decoders.py
+import logging
+import cv2
+
+try:
+    import av  # PyAV is optional; only needed for the "pyav" backend
+except ImportError:
+    av = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class VideoDecoder:
+    """Iterate over the sampled frames of a video as RGB (or grayscale) arrays.
+
+    Every backend yields ``(frame_index, seconds, frame)`` tuples where the
+    frame is already reduced to at most ``target_width`` pixels wide, so the
+    caller never has to ``cv2.resize``/``cvtColor`` itself.
+    """
+
+    name = None
+    keyframes = False  # whether keyframes_only really skips decoding the other frames
+
+    def __init__(self, video_path, frame_skip=5, target_width=640, keyframes_only=False, pixel_format='rgb'):
+        if pixel_format not in ('rgb', 'gray'):
+            raise ValueError(f"Unsupported pixel format: {pixel_format}")
+        self.video_path = video_path
+        self.frame_skip = max(1, int(frame_skip))
+        self.target_width = target_width
+        self.keyframes_only = keyframes_only
+        self.pixel_format = pixel_format
+
+    def frames(self):
+        raise NotImplementedError
+
+    @property
+    def duration(self):
+        """Length of the video in seconds, or None when the container does not say."""
+        return None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def scaled_size(self, width, height):
+        if self.target_width and width > self.target_width:
+            scale = self.target_width / width
+            return int(width * scale), int(height * scale)
+        return width, height
+
+
+class OpenCVDecoder(VideoDecoder):
+    """The original ``cv2.VideoCapture`` path.
+
+    Skipped frames are only ``grab()``-ed, which still decodes them but avoids
+    the BGR conversion and copy that ``read()`` does for every frame.
+    """
+
+    name = 'opencv'
+    hardware_acceleration = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.keyframes_only:
+            logger.warning(f"{self.name} decoder cannot skip non-keyframes; sampling every {self.frame_skip}th frame")
+        self.capture = self.open_capture()
+        if not self.capture.isOpened():
+            raise ValueError(f"Could not open video file: {self.video_path}")
+
+    def open_capture(self):
+        if self.hardware_acceleration and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            return cv2.VideoCapture(
+                self.video_path,
+                cv2.CAP_FFMPEG,
+                [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY],
+            )
+        return cv2.VideoCapture(self.video_path)
+
+    @property
+    def duration(self):
+        frame_count = self.capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        if frame_count > 0 and fps > 0:
+            return frame_count / fps
+        return None
+
+    def frames(self):
+        frame_index = -1
+        while True:
+            if not self.capture.grab():
+                break
+            frame_index += 1
+            if (frame_index + 1) % self.frame_skip != 0:
+                continue
+
+            ret, frame = self.capture.retrieve()
+            if not ret:
+                break
+            seconds = self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+            height, width = frame.shape[:2]
+            size = self.scaled_size(width, height)
+            if size != (width, height):
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+            if self.pixel_format == 'gray':
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            else:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            yield frame_index, seconds, frame
+
+    def close(self):
+        if self.capture:
+            self.capture.release()
+            self.capture = None
+
+
+class HardwareOpenCVDecoder(OpenCVDecoder):
+    """OpenCV/FFmpeg with whatever hardware decoder (VAAPI, NVDEC, D3D11...) is available."""
+
+    name = 'opencv-hw'
+    hardware_acceleration = True
+
+
+class PyAVDecoder(VideoDecoder):
+    """FFmpeg through PyAV.
+
+    In keyframe-only mode the codec is told to drop every non-I-frame before
+    decoding, and frames are scaled and converted by libswscale in one step.
+    """
+
+    name = 'pyav'
+    keyframes = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if av is None:
+            raise ValueError("The pyav decoder requires the 'av' package")
+        try:
+            self.container = av.open(self.video_path)
+        except av.FFmpegError as e:
+            raise ValueError(f"Could not open video file: {self.video_path}") from e
+        if not self.container.streams.video:
+            self.close()
+            raise ValueError(f"No video stream in file: {self.video_path}")
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+        if self.keyframes_only:
+            self.stream.codec_context.skip_frame = 'NONKEY'
+
+    @property
+    def duration(self):
+        if self.stream.duration and self.stream.time_base:
+            return float(self.stream.duration * self.stream.time_base)
+        if self.container.duration:
+            return self.container.duration / av.time_base
+        return None
+
+    def frames(self):
+        av_format = 'gray' if self.pixel_format == 'gray' else 'rgb24'
+        fps = float(self.stream.average_rate) if self.stream.average_rate else None
+        for frame_index, frame in enumerate(self.container.decode(self.stream)):
+            seconds = float(frame.time) if frame.time is not None else 0.0
+            if self.keyframes_only:
+                # Keyframes are sparse already, so they are never sub-sampled
+                # further; report their position in the full frame sequence.
+                if fps and frame.time is not None:
+                    frame_index = int(round(seconds * fps))
+            elif (frame_index + 1) % self.frame_skip != 0:
+                continue
+            width, height = self.scaled_size(frame.width, frame.height)
+            yield frame_index, seconds, frame.to_ndarray(
+                width=width, height=height, format=av_format, interpolation='AREA'
+            )
+
+    def close(self):
+        if getattr(self, 'container', None):
+            self.container.close()
+            self.container = None
+
+
+DECODERS = {
+    decoder.name: decoder
+    for decoder in (OpenCVDecoder, HardwareOpenCVDecoder, PyAVDecoder)
+}
+
+
+def available_decoders():
+    return [name for name, decoder in DECODERS.items() if decoder is not PyAVDecoder or av is not None]
+
+
+def choose_decoder(requested=None, fast=False, default='opencv'):
+    """Pick the decoder for an upload; raises ValueError with a client-facing message.
+
+    Fast mode needs a backend that can skip non-keyframes. When the client did
+    not name a decoder the default is swapped for one that can; a decoder the
+    client asked for explicitly is never silently replaced.
+    """
+    name = requested or default
+    if name not in available_decoders():
+        raise ValueError(f"Unknown video decoder. Choose one of: {', '.join(available_decoders())}.")
+    if fast and not DECODERS[name].keyframes:
+        capable = [other for other in available_decoders() if DECODERS[other].keyframes]
+        if requested or not capable:
+            raise ValueError(
+                f"The {name} decoder cannot decode keyframes only; "
+                + (f"use mode=fast with: {', '.join(capable)}." if capable else "fast mode is unavailable.")
+            )
+        name = capable[0]
+    return name
+
+
+def get_decoder(name, video_path, **kwargs):
+    try:
+        decoder_class = DECODERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown video decoder: {name}") from None
+    return decoder_class(video_path, **kwargs)
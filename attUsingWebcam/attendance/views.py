@@ -1,29 +1,82 @@
 # attendance/views.py
 import os
-import cv2
 import json
-import numpy as np
-import face_recognition
 from django.conf import settings
-from django.http import HttpResponse, FileResponse
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified, FileResponse
+from django.views.static import serve
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
 from rest_framework.response import Response
-from .models import Student, Attendance  # Update with correct import path
-from .serializers import StudentSerializer, AttendanceSerializer
-from django.utils import timezone
+from .models import Student, Attendance, Camera, ClassSession  # Update with correct import path
+from .serializers import StudentSerializer, AttendanceSerializer, FaceEncodingSerializer
+from .video_decoders import choose_decoder
+from .completion import CompletionPolicy
+from .gallery import get_galleries
+from .versions import get_version
+from .recognition import (
+    create_attendance_records,
+    decode_image,
+    detect_and_encode,
+    match_faces,
+    recognition_log,
+    save_recognition_log,
+    scan_video,
+)
 from io import BytesIO
 import openpyxl
 from reportlab.pdfgen import canvas
 import logging
 import tempfile
+import hashlib
 from collections import defaultdict
 
+try:
+    import orjson  # optional, much faster for large rosters
+except ImportError:
+    orjson = None
+
 
 
 logger = logging.getLogger(__name__)
 
+
+def dumps_json(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def get_camera_layout(camera_id):
+    """Return (layout, error_response) for the optional 'camera' request field."""
+    if not camera_id:
+        return None, None
+    try:
+        return Camera.objects.get(pk=camera_id).layout(), None
+    except (Camera.DoesNotExist, ValueError):
+        return None, Response({"error": "Unknown camera."}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def get_request_galleries(session_id):
+    """Return ((gallery, fallback), error_response) for the optional 'session' request field."""
+    try:
+        return get_galleries(session_id), None
+    except (ClassSession.DoesNotExist, ValueError):
+        return None, Response({"error": "Unknown session."}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def serve_derived_image(request, path):
+    """Serve normalized images and thumbnails during development (DEBUG only).
+
+    Their names are content hashes, so they never change; production serves
+    the same headers from the web server (see deploy/nginx.conf).
+    """
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, 'derived'))
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 class StudentCreateAPIView(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
@@ -35,11 +88,114 @@ class StudentCreateAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class StudentFaceEncodingCreateAPIView(APIView):
+    """Add extra enrollment images ('image', may be repeated) to an existing student."""
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, pk, format=None):
+        try:
+            student = Student.objects.get(pk=pk)
+        except Student.DoesNotExist:
+            return Response({"error": "Student not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        images = request.FILES.getlist('image')
+        if not images:
+            return Response({"error": "No image file provided."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Same limit as the recognition image upload
+        max_size = 10 * 1024 * 1024  # 10 MB
+        if any(image.size > max_size for image in images):
+            return Response(
+                {"error": "Image file is too large. Maximum allowed size is 10 MB."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        uploads = [FaceEncodingSerializer(data={'image': image}) for image in images]
+        errors = [upload.errors for upload in uploads if not upload.is_valid()]
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        for upload in uploads:
+            upload.save(student=student)
+        return Response([upload.data for upload in uploads], status=status.HTTP_201_CREATED)
+
+
 class StudentListAPIView(APIView):
+    """Student roster for front-ends that poll it.
+
+    Query parameters (all optional, without them the response is the full list):
+      fields     comma-separated subset of StudentSerializer fields
+      page       1-based page number; the response becomes {count, page, page_size, results}
+      page_size  rows per page (default 100, max 1000)
+      compact=1  {"fields": [...], "rows": [[...], ...]} built straight from values_list()
+
+    Payloads are cached per student-table version and carry an ETag, so an
+    unchanged roster is answered with 304 without touching the database.
+    """
+    default_page_size = 100
+    max_page_size = 1000
+
     def get(self, request, format=None):
-        students = Student.objects.all()
-        serializer = StudentSerializer(students, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        params = request.query_params
+        fields = [f for f in params.get('fields', '').split(',') if f] or list(StudentSerializer.Meta.fields)
+        unknown = set(fields) - set(StudentSerializer.Meta.fields)
+        if unknown:
+            return Response({"error": f"Unknown fields: {', '.join(sorted(unknown))}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = int(params['page']) if 'page' in params else None
+            page_size = min(int(params.get('page_size', self.default_page_size)), self.max_page_size)
+        except ValueError:
+            return Response({"error": "page and page_size must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        if (page is not None and page < 1) or page_size < 1:
+            return Response({"error": "page and page_size must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+        compact = params.get('compact') in ('1', 'true')
+
+        variant = f"{','.join(fields)}:{page}:{page_size if page else ''}:{int(compact)}"
+        etag = '"' + hashlib.md5(f"{get_version('students')}:{variant}".encode()).hexdigest() + '"'
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            return self.cached_response(HttpResponseNotModified(), etag)
+
+        cache_key = f"attendance:studentslist:{etag}"
+        payload = cache.get(cache_key)
+        if payload is None:
+            payload = dumps_json(self.build(fields, page, page_size, compact))
+            cache.set(cache_key, payload, 3600)
+        return self.cached_response(HttpResponse(payload, content_type='application/json'), etag)
+
+    @staticmethod
+    def cached_response(response, etag):
+        response['ETag'] = etag
+        # Clients may keep the payload but must revalidate it every time
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def build(self, fields, page, page_size, compact):
+        # Never load face_encoding (a ~3 KB JSON blob per student) for the list
+        students = Student.objects.only(*fields).order_by('id')
+        count = None
+        if page is not None:
+            count = students.count()
+            students = students[(page - 1) * page_size:page * page_size]
+
+        if compact:
+            # values_list() gives file names; turn image columns into URLs like the serializer does
+            image_columns = [
+                (index, Student._meta.get_field(field).storage)
+                for index, field in enumerate(fields) if field in ('profile_image', 'thumbnail')
+            ]
+            rows = []
+            for row in students.values_list(*fields):
+                if image_columns:
+                    row = list(row)
+                    for index, storage in image_columns:
+                        row[index] = storage.url(row[index]) if row[index] else None
+                rows.append(row)
+            data = {"fields": fields, "rows": rows}
+        else:
+            data = StudentSerializer(students, many=True, fields=fields).data
+
+        if page is None:
+            return data
+        return {"count": count, "page": page, "page_size": page_size, "results": data}
 
 
 
@@ -61,15 +217,46 @@ class AttendanceUploadAPIView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            # "fast" mode only looks at keyframes (I-frames)
+            fast = request.data.get('mode') == 'fast'
+            try:
+                decoder = choose_decoder(request.data.get('decoder'), fast, getattr(settings, 'VIDEO_DECODER', 'opencv'))
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            layout, error = get_camera_layout(request.data.get('camera'))
+            if error:
+                return error
+            galleries, error = get_request_galleries(request.data.get('session'))
+            if error:
+                return error
+            try:
+                policy = CompletionPolicy.from_request(
+                    request.data, galleries[0], session=bool(request.data.get('session'))
+                )
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
             # Use temporary file with automatic cleanup
             with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp_file:
                 for chunk in video_file.chunks():
                     tmp_file.write(chunk)
                 temp_path = tmp_file.name
 
-            recognized_students = self.process_video(temp_path)
+            scan = self.process_video(
+                temp_path, decoder=decoder, fast=fast, layout=layout, galleries=galleries, policy=policy,
+                session_id=request.data.get('session') or None, camera_id=request.data.get('camera') or None
+            )
             return Response(
-                {"message": "Attendance marked.", "students": [s.name for s in recognized_students]},
+                {
+                    "message": "Attendance marked.",
+                    "students": [s.name for s in scan.students],
+                    "decoder": decoder,
+                    "mode": "fast" if fast else "normal",
+                    "stop_reason": scan.stop_reason,
+                    "partial": scan.partial,
+                    "coverage": scan.coverage,
+                },
                 status=status.HTTP_200_OK
             )
             
@@ -85,109 +272,23 @@ class AttendanceUploadAPIView(APIView):
                     logger.warning(f"Could not delete temporary file {temp_path}, retrying...")
                     # Add retry logic or async cleanup if needed
 
-    def process_video(self, video_path):
-        video_capture = None
+    def process_video(self, video_path, decoder='opencv', fast=False, layout=None, galleries=None, policy=None,
+                      session_id=None, camera_id=None):
         try:
-            video_capture = cv2.VideoCapture(video_path)
-            if not video_capture.isOpened():
-                raise ValueError(f"Could not open video file: {video_path}")
-
-            # Get cached encodings
-            known_encodings, student_mapping = self.get_cached_encodings()
-            recognized_students = set()
-
-            # Video processing parameters
-            frame_skip = 5  # Process every 5th frame
-            target_width = 640  # Reduced resolution
-            confidence_threshold = 0.5
-            max_processing_seconds = 30
-
-            frame_count = 0
-            start_time = timezone.now()
-
-            while True:
-                if (timezone.now() - start_time).seconds > max_processing_seconds:
-                    logger.warning("Exceeded maximum processing time")
-                    break
-
-                ret, frame = video_capture.read()
-                if not ret:
-                    break
-
-                frame_count += 1
-                if frame_count % frame_skip != 0:
-                    continue
-
-                # Resize frame
-                height, width = frame.shape[:2]
-                if width > target_width:
-                    scale = target_width / width
-                    frame = cv2.resize(frame, (int(width * scale), int(height * scale)))
-
-                # Convert to RGB
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-                # Face detection
-                face_locations = face_recognition.face_locations(rgb_frame, model="hog")
-                if not face_locations:
-                    continue
-
-                # Process face encodings
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-                for face_encoding in face_encodings:
-                    face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-                    best_match_index = np.argmin(face_distances)
-                    
-                    if face_distances[best_match_index] < confidence_threshold:
-                        recognized_students.add(student_mapping[best_match_index])
-
-            self.create_attendance_records(recognized_students)
-            return recognized_students
+            # Get cached encodings (the session roster first, if one was given)
+            gallery, fallback = galleries or get_galleries()
+            scan = scan_video(
+                video_path, gallery, decoder=decoder, fast=fast, layout=layout, fallback=fallback, policy=policy
+            )
+            self.create_attendance_records(scan.students)
+            save_recognition_log(recognition_log(scan.matches, 'video', session_id, camera_id))
+            return scan
 
         except Exception as e:
             logger.error(f"Video processing error: {str(e)}", exc_info=True)
             raise
-        finally:
-            if video_capture:
-                video_capture.release()
 
-    @staticmethod
-    def get_cached_encodings():
-        if not hasattr(settings, 'FACE_ENCODINGS_CACHE'):
-            students = Student.objects.exclude(face_encoding__isnull=True).only('id', 'name', 'face_encoding')
-            encodings = []
-            mapping = []
-            
-            for student in students:
-                try:
-                    encoding = np.array(json.loads(student.face_encoding))
-                    encodings.append(encoding)
-                    mapping.append(student)
-                except (TypeError, json.JSONDecodeError) as e:
-                    logger.warning(f"Invalid encoding for student {student.id}: {str(e)}")
-            
-            settings.FACE_ENCODINGS_CACHE = (encodings, mapping)
-            logger.info("Loaded and cached face encodings")
-        
-        return settings.FACE_ENCODINGS_CACHE
-
-    @staticmethod
-    def create_attendance_records(students):
-        today = timezone.now().date()
-        existing = set(Attendance.objects.filter(
-            date=today, 
-            student__in=students
-        ).values_list('student_id', flat=True))
-
-        new_attendance = [
-            Attendance(student=student, date=today)
-            for student in students
-            if student.id not in existing
-        ]
-
-        if new_attendance:
-            Attendance.objects.bulk_create(new_attendance)
-            logger.info(f"Created {len(new_attendance)} new attendance records")
+    create_attendance_records = staticmethod(create_attendance_records)
 
 
 
@@ -524,12 +625,26 @@ class AttendanceImageUploadAPIView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            layout, error = get_camera_layout(request.data.get('camera'))
+            if error:
+                return error
+            galleries, error = get_request_galleries(request.data.get('session'))
+            if error:
+                return error
+
             # Process image in memory without saving to disk
             image_data = image_file.read()
-            recognized_students = self.process_image(image_data)
+            result = self.process_image(
+                image_data, layout=layout, galleries=galleries,
+                session_id=request.data.get('session') or None, camera_id=request.data.get('camera') or None
+            )
             
             return Response(
-                {"message": "Attendance marked.", "students": [s.name for s in recognized_students]},
+                {
+                    "message": "Attendance marked.",
+                    "students": [s.name for s in result.students],
+                    "faces": result.faces(),
+                },
                 status=status.HTTP_200_OK
             )
             
@@ -537,85 +652,26 @@ class AttendanceImageUploadAPIView(APIView):
             logger.error(f"Error processing request: {str(e)}", exc_info=True)
             return Response({"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def process_image(self, image_data):
+    def process_image(self, image_data, layout=None, galleries=None, session_id=None, camera_id=None):
         try:
-            # Load image from bytes
-            image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
-            if image is None:
-                raise ValueError("Invalid image file")
-
-            # Resize large images for faster processing
-            max_dimension = 2000
-            height, width = image.shape[:2]
-            if max(height, width) > max_dimension:
-                scale = max_dimension / max(height, width)
-                image = cv2.resize(image, (int(width * scale), int(height * scale)))
-
-            # Convert to RGB
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-            # Get pre-loaded encodings
-            known_encodings, student_mapping = self.get_cached_encodings()
-
-            # Detect faces
-            face_locations = face_recognition.face_locations(rgb_image, model="hog")
-            logger.info(f"Detected {len(face_locations)} faces")
-
-            # Process encodings
-            recognized_students = set()
-            for encoding in face_recognition.face_encodings(rgb_image, face_locations):
-                matches = face_recognition.compare_faces(known_encodings, encoding, tolerance=0.5)
-                face_distances = face_recognition.face_distance(known_encodings, encoding)
-                
-                # Get best match instead of first match
-                best_match_index = np.argmin(face_distances)
-                if matches[best_match_index]:
-                    recognized_students.add(student_mapping[best_match_index])
+            # ROI tiles are scaled individually, so keep full resolution for camera uploads
+            rgb_image = decode_image(image_data, max_dimension=None if layout else 2000)
+
+            # Get pre-loaded encodings (the session roster first, if one was given)
+            gallery, fallback = galleries or get_galleries()
+
+            # Detect faces and rank each one's nearest candidates
+            encodings = detect_and_encode(rgb_image, layout=layout)
+            result = match_faces(encodings, gallery, fallback=fallback)
 
             # Create attendance records
-            self.create_attendance_records(recognized_students)
+            self.create_attendance_records(result.students)
+            save_recognition_log(recognition_log([(None, None, result)], 'image', session_id, camera_id))
             
-            return recognized_students
+            return result
 
         except Exception as e:
             logger.error(f"Image processing error: {str(e)}", exc_info=True)
             raise
 
-    @staticmethod
-    def get_cached_encodings():
-        # Cache encodings to avoid database hits on every request
-        if not hasattr(settings, 'FACE_ENCODINGS_CACHE'):
-            students = Student.objects.exclude(face_encoding__isnull=True).only('id', 'name', 'face_encoding')
-            encodings = []
-            mapping = []
-            
-            for student in students:
-                try:
-                    encoding = np.array(json.loads(student.face_encoding))
-                    encodings.append(encoding)
-                    mapping.append(student)
-                except (TypeError, json.JSONDecodeError) as e:
-                    logger.warning(f"Invalid encoding for student {student.id}: {str(e)}")
-            
-            settings.FACE_ENCODINGS_CACHE = (encodings, mapping)
-            logger.info("Loaded and cached face encodings")
-        
-        return settings.FACE_ENCODINGS_CACHE
-
-    @staticmethod
-    def create_attendance_records(students):
-        today = timezone.now().date()
-        existing = set(Attendance.objects.filter(
-            date=today, 
-            student__in=students
-        ).values_list('student_id', flat=True))
-
-        new_attendance = [
-            Attendance(student=student, date=today)
-            for student in students
-            if student.id not in existing
-        ]
-
-        if new_attendance:
-            Attendance.objects.bulk_create(new_attendance)
-            logger.info(f"Created {len(new_attendance)} new attendance records")
\ No newline at end of file
+    create_attendance_records = staticmethod(create_attendance_records)
@@ -0,0 +1,81 @@
+# attendance/write_queue.py
+#
+# SQLite allows one writer at a time. Instead of every upload request opening
+# its own write transaction (and queueing on the database lock), requests hand
+# their recognized students to a writer thread, which coalesces everything that
+# arrived in the last few milliseconds into one transaction. There is one
+# writer per server process; duplicates across processes are prevented by the
+# unique (student, date) constraint on Attendance.
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import Attendance
+
+
+logger = logging.getLogger(__name__)
+
+
+class AttendanceWriteQueue:
+    def __init__(self, max_batch=500, max_wait=0.02):
+        self.max_batch = max_batch
+        self.max_wait = max_wait  # seconds to wait for more requests before writing
+        self.pending = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, students):
+        """Queue students for today's attendance; the Future resolves to the number of rows created."""
+        future = Future()
+        self.ensure_started()
+        self.pending.put(({student.id for student in students}, future))
+        return future
+
+    def ensure_started(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name='attendance-writer', daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        while True:
+            batch = [self.pending.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self.pending.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+
+            close_old_connections()
+            try:
+                created = self.write(set().union(*(student_ids for student_ids, future in batch)))
+            except Exception as e:
+                logger.error(f"Attendance batch write failed: {str(e)}", exc_info=True)
+                for student_ids, future in batch:
+                    future.set_exception(e)
+            else:
+                for student_ids, future in batch:
+                    future.set_result(len(student_ids & created))
+
+    @staticmethod
+    def write(student_ids):
+        today = timezone.now().date()
+        with transaction.atomic():
+            existing = set(Attendance.objects.filter(
+                date=today,
+                student_id__in=student_ids
+            ).values_list('student_id', flat=True))
+            created = student_ids - existing
+            if created:
+                # The queue is per process; other workers' writers may insert the same rows
+                Attendance.objects.bulk_create(
+                    [Attendance(student_id=student_id) for student_id in created], ignore_conflicts=True
+                )
+                logger.info(f"Created {len(created)} new attendance records")
+        return created
+
+
+attendance_write_queue = AttendanceWriteQueue()